@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Cost of scanning archived games: memory-mapped columns vs per-game JSON.
+
+Writes ``--games`` synthetic games (4 pegs, 6 colors, 1-10 guesses each) to a
+temporary archive with games.archive.ShardWriter, then computes the win rate,
+the mean number of guesses and how often each color opens a game:
+
+- json: the same games as the list of guess dicts ``Room.game_state`` used to
+  hold, decoded one game at a time as a scan over the table would
+- memmap: games.archive.ArchiveShard, one vectorized pass over each column
+
+Needs numpy (``pip install 'bncapi[archive]'``).
+
+usage: python -m benchmarks.bench_archive [--games 1000000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bncapi.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from games import archive  # noqa: E402
+
+CODE_LENGTH = 4
+NUM_OF_COLORS = 6
+STARTED_AT = 1_700_000_000_000
+
+
+def synthetic_games(count, seed=0):
+    rng = random.Random(seed)
+    for game_id in range(1, count + 1):
+        guesses = []
+        for seq in range(rng.randint(1, 10)):
+            code = "".join(str(rng.randint(1, NUM_OF_COLORS)) for _ in range(CODE_LENGTH))
+            bulls = rng.randint(0, CODE_LENGTH - 1)
+            guesses.append((seq, code, bulls, rng.randint(0, CODE_LENGTH - bulls)))
+        won = rng.random() < 0.6
+        if won:
+            guesses[-1] = (guesses[-1][0], guesses[-1][1], CODE_LENGTH, 0)
+        yield game_id, guesses, won
+
+
+def write_archive(directory, count):
+    games, guesses, history = [], [], []
+    first_guess = 0
+    for game_id, game_guesses, won in synthetic_games(count):
+        games.append(
+            archive.GAME_RECORD.pack(
+                game_id, game_id, 0, STARTED_AT, STARTED_AT + 60_000,
+                first_guess, len(game_guesses), 1, won,
+            )
+        )
+        for seq, code, bulls, cows in game_guesses:
+            guesses.append(
+                archive.GUESS_RECORD.pack(
+                    game_id, archive.pack_code(code), seq * 5000, seq, 0, bulls, cows
+                )
+            )
+        history.append(
+            json.dumps(
+                [
+                    {"player": "p", "guess": code, "bulls": bulls, "cows": cows}
+                    for _seq, code, bulls, cows in game_guesses
+                ]
+            )
+        )
+        first_guess += len(game_guesses)
+
+    with archive.ShardWriter(CODE_LENGTH, NUM_OF_COLORS, directory) as writer:
+        writer.append(games, guesses)
+    return history
+
+
+def scan_json(history):
+    won = guesses = 0
+    openers = [0] * (NUM_OF_COLORS + 1)
+    for encoded in history:
+        game = json.loads(encoded)
+        guesses += len(game)
+        won += any(guess["bulls"] == CODE_LENGTH for guess in game)
+        openers[int(game[0]["guess"][0])] += 1
+    return won / len(history), guesses / len(history), openers[1:]
+
+
+def scan_memmap(directory):
+    import numpy as np
+
+    shard = archive.ArchiveShard(CODE_LENGTH, NUM_OF_COLORS, directory)
+    games = shard.games
+    first_codes = shard.guesses["code"][games["first_guess"]]
+    first_pegs = shard.pegs(first_codes)[:, 0]
+    openers = np.bincount(first_pegs, minlength=NUM_OF_COLORS + 1)[1:]
+    return (
+        float(games["won"].mean()),
+        float(games["guess_count"].mean()),
+        openers.tolist(),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        history = write_archive(directory, args.games)
+        print(f"wrote {args.games} games in {time.perf_counter() - start:.1f}s")
+
+        results = {}
+        print(f"{'approach':>8} {'seconds':>9} {'games/s':>12}")
+        for name, scan in (
+            ("json", lambda: scan_json(history)),
+            ("memmap", lambda: scan_memmap(directory)),
+        ):
+            start = time.perf_counter()
+            results[name] = scan()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>8} {elapsed:>9.3f} {args.games / elapsed:>12.0f}")
+
+    if results["json"][2] != results["memmap"][2]:
+        print("results differ:", results)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+CPU cost of one room broadcast as the room grows.
+
+- per-consumer: the event carries the state dict; the channel layer packs it for
+  every member and every consumer runs json.dumps on it (the old path)
+- serialize-once: the sender encodes the frames once; the layer packs plain
+  strings and consumers write them as is. Only the variant the players use
+  (JSON, full updates) is encoded; "all variants" encodes all four
+
+usage: python -m benchmarks.bench_broadcast [--guesses 50] [--rounds 200]
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+
+from games import protocol
+
+
+def make_state(guesses: int, players: int = 8) -> dict:
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return {
+        "players": [f"player{i:02d}" for i in range(players)],
+        "guesses": [
+            {
+                "player": f"player{i % players:02d}",
+                "guess": "".join(str(1 + (i + k) % 6) for k in range(4)),
+                "bulls": i % 4,
+                "cows": (i + 1) % 3,
+                "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            }
+            for i in range(guesses)
+        ],
+        "remaining_guesses": 100 - guesses,
+        "game_won": False,
+        "game_over": False,
+        "winner": None,
+        "game_started": True,
+        "version": guesses,
+    }
+
+
+def per_consumer(state: dict, members: int):
+    event = {"type": "game_update", "state": state}
+    for _ in range(members):
+        received = msgpack.unpackb(msgpack.packb(event))
+        json.dumps({"type": "update", "state": received["state"]})
+
+
+def serialize_once(state: dict, previous: dict, members: int, variants):
+    event = protocol.broadcast_event(state, previous, variants=variants)
+    for _ in range(members):
+        received = msgpack.unpackb(msgpack.packb(event))
+        # written to the socket as is
+        received["frames"][protocol.WIRE_JSON][protocol.UPDATES_FULL]
+
+
+def measure(fn, rounds: int, *args) -> float:
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(*args)
+    return (time.process_time() - start) / rounds * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guesses", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--sizes", default="1,2,4,8,16,32,64")
+    args = parser.parse_args()
+
+    previous = make_state(args.guesses - 1)
+    state = make_state(args.guesses)
+
+    print(f"guesses={args.guesses} rounds={args.rounds}  (CPU us per broadcast)")
+    print(
+        f"{'players':>8} {'per-consumer':>14} {'serialize-once':>16} "
+        f"{'speedup':>8} {'all variants':>14}"
+    )
+    used = [(protocol.WIRE_JSON, protocol.UPDATES_FULL)]
+    for members in (int(size) for size in args.sizes.split(",")):
+        old = measure(per_consumer, args.rounds, state, members)
+        new = measure(serialize_once, args.rounds, state, previous, members, used)
+        every = measure(
+            serialize_once, args.rounds, state, previous, members, protocol.VARIANTS
+        )
+        print(
+            f"{members:>8} {old:>14.1f} {new:>16.1f} {old / new:>7.1f}x "
+            f"{every:>14.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
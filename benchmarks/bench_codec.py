@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Encode/decode throughput of the JSON codecs (bncapi.codec) on game-state payloads.
+
+Codecs that are not installed are skipped; install the extras to compare:
+    pip install orjson msgspec
+
+usage: python -m benchmarks.bench_codec [--guesses 10,50,100] [--seconds 0.5]
+"""
+import argparse
+import sys
+import time
+
+from bncapi import codec
+from benchmarks.bench_broadcast import make_state
+
+
+def throughput(fn, payload, seconds: float) -> float:
+    done = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn(payload)
+        done += 100
+    return done / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guesses", default="10,50,100")
+    parser.add_argument("--seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    codecs = []
+    for name in codec.CODECS:
+        try:
+            codecs.append(codec.get_codec(name))
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+
+    print(f"{'codec':>8} {'guesses':>8} {'bytes':>7} {'encode/s':>10} {'decode/s':>10}")
+    for guesses in (int(n) for n in args.guesses.split(",")):
+        state = {"type": "update", "state": make_state(guesses)}
+        for json_codec in codecs:
+            encoded = json_codec.dumpb(state)
+            encode = throughput(json_codec.dumpb, state, args.seconds)
+            decode = throughput(json_codec.loads, encoded, args.seconds)
+            print(
+                f"{json_codec.name:>8} {guesses:>8} {len(encoded):>7} "
+                f"{encode:>10.0f} {decode:>10.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Requests/sec and latency of the API under many concurrent clients.
+
+Drives a running server (e.g. ``gunicorn bncapi.asgi:application -k
+uvicorn.workers.UvicornWorker``) with ``--clients`` concurrent keep-alive
+connections, each sending its next request as soon as the previous one
+answered. Sync views each hold a thread of the sync_to_async pool while they
+run, so their throughput flattens once the pool is busy; the async views only
+leave the event loop for the database. Run it against a checkout from before
+the async rewrite and against this one to compare.
+
+Conditional GETs and cached responses would hide the database work, so the
+benchmark sends no validators and adds a unique query parameter per request.
+
+usage: python -m benchmarks.bench_concurrency --url http://localhost:8000
+       [--token TOKEN] [--clients 10,100,200] [--seconds 10]
+       [--path /api/games/rooms --path /api/users/leaderboard]
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import sys
+import time
+
+import httpx
+
+DEFAULT_PATHS = ("/api/games/rooms", "/api/users/leaderboard", "/api/users/me")
+
+
+async def client(http, path, deadline, counter, latencies, errors):
+    while time.perf_counter() < deadline:
+        # unique query so the response cache never answers
+        params = {"_": next(counter)}
+        start = time.perf_counter()
+        try:
+            response = await http.get(path, params=params)
+        except httpx.HTTPError:
+            errors.append(None)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+
+async def run(url, token, path, clients, seconds) -> dict:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    latencies, errors = [], []
+    counter = itertools.count()
+    async with httpx.AsyncClient(
+        base_url=url, headers=headers, limits=limits, timeout=60
+    ) as http:
+        # warm up connections and the server's caches of compiled code
+        await http.get(path, params={"_": "warmup"})
+        start = time.perf_counter()
+        deadline = start + seconds
+        await asyncio.gather(
+            *(
+                client(http, path, deadline, counter, latencies, errors)
+                for _ in range(clients)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "errors": len(errors),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", default=None, help="knox token for authed paths")
+    parser.add_argument("--clients", default="10,100,200")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--path", action="append", dest="paths")
+    args = parser.parse_args()
+
+    print(f"{'path':>28} {'clients':>8} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for path in args.paths or DEFAULT_PATHS:
+        for clients in (int(n) for n in args.clients.split(",")):
+            result = asyncio.run(run(args.url, args.token, path, clients, args.seconds))
+            print(
+                f"{path:>28} {clients:>8} {result['rps']:>10.0f} "
+                f"{result['p50']:>8.1f} {result['p99']:>8.1f} {result['errors']:>7}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
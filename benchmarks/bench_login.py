@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Login throughput and event-loop stalls while many password checks are in flight.
+
+Simulates the password part of concurrent logins (``--fail`` of them with a
+wrong password) without a database:
+
+- inline: verified on the event loop, as ``acheck_password`` does; a failed
+  login hashes twice (authenticate, then the fallback check_password)
+- thread: verified in the sync_to_async thread pool (the old sync views); a
+  failed login also hashes twice
+- pool: users.hashing.verify_password in the process pool; one hash per login
+
+"loop lag" is the worst delay seen by a 10ms ticker running beside the logins:
+how long every other request on the worker would have waited.
+
+usage: python -m benchmarks.bench_login [--logins 64] [--concurrency 16,64] [--fail 0.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bncapi.settings")
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.contrib.auth import hashers  # noqa: E402
+
+from users import hashing  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+
+
+async def login_inline(password, encoded) -> bool:
+    if hashers.check_password(password, encoded):
+        return True
+    return hashers.check_password(password, encoded)
+
+
+async def login_thread(password, encoded) -> bool:
+    check = sync_to_async(hashers.check_password, thread_sensitive=False)
+    if await check(password, encoded):
+        return True
+    return await check(password, encoded)
+
+
+async def login_pool(password, encoded) -> bool:
+    is_correct, _must_update = await hashing.verify_password(password, encoded)
+    return is_correct
+
+
+async def ticker(stop: asyncio.Event, lags: list):
+    interval = 0.01
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def storm(login, encoded, logins, concurrency, fail) -> tuple[float, float]:
+    gate = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    lags = []
+
+    async def one(i):
+        password = "wrong" if i < logins * fail else PASSWORD
+        async with gate:
+            await login(password, encoded)
+
+    lag_task = asyncio.create_task(ticker(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    return logins / elapsed, max(lags, default=0.0) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", default="16,64")
+    parser.add_argument("--fail", type=float, default=0.5)
+    args = parser.parse_args()
+
+    hashing.hasher_pool.max_pending = max(
+        int(n) for n in args.concurrency.split(",")
+    )
+    encoded = hashers.make_password(PASSWORD)
+    # start the workers before timing anything
+    asyncio.run(hashing.verify_password(PASSWORD, encoded))
+
+    approaches = [
+        ("inline", login_inline),
+        ("thread", login_thread),
+        ("pool", login_pool),
+    ]
+
+    print(f"hasher: {hashers.identify_hasher(encoded).algorithm}, ", end="")
+    print(f"pool workers: {hashing.hasher_pool.workers}, cpus: {os.cpu_count()}")
+    print(f"{'approach':>8} {'concurrency':>12} {'logins/s':>10} {'loop lag ms':>12}")
+    for concurrency in (int(n) for n in args.concurrency.split(",")):
+        for name, login in approaches:
+            rate, lag = asyncio.run(
+                storm(login, encoded, args.logins, concurrency, args.fail)
+            )
+            print(f"{name:>8} {concurrency:>12} {rate:>10.1f} {lag:>12.0f}")
+
+    hashing.hasher_pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Rows/sec for turning ``.values()`` rows into a JSON list response.
+
+Compares building one pydantic model per row and dumping them again (what the
+list endpoints did through Ninja) with bncapi.serialization.dump_rows, which
+validates and encodes the whole list in one TypeAdapter call. "codec only" is
+the floor: encoding the raw rows without coercing any types.
+
+usage: python -m benchmarks.bench_serialization [--rows 1000,10000,100000]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from pydantic import BaseModel, ConfigDict
+
+from bncapi import codec
+from bncapi.serialization import dump_rows
+
+
+class ActivityRow(BaseModel):
+    # same fields as users.schemas.ActivityResponseSchema
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    verb: str
+    timestamp: datetime
+    actor_object_id: int | None
+    action_object_object_id: int | None
+    target_object_id: int | None
+
+
+def make_rows(count: int) -> list[dict]:
+    # actstream stores object ids as strings; the schema coerces them to int
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": i,
+            "verb": "guessed_code" if i % 3 else "joined_room",
+            "timestamp": start + timedelta(seconds=i),
+            "actor_object_id": str(i % 500),
+            "action_object_object_id": None if i % 3 else str(i % 97),
+            "target_object_id": str(i % 97) if i % 3 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def per_row_models(rows) -> bytes:
+    models = [ActivityRow.model_validate(row) for row in rows]
+    return codec.dumpb([model.model_dump() for model in models])
+
+
+def bulk(rows) -> bytes:
+    return dump_rows(ActivityRow, rows)
+
+
+def codec_only(rows) -> bytes:
+    return codec.dumpb(rows)
+
+
+def rows_per_second(fn, rows, seconds: float) -> float:
+    done = 0
+    start = time.perf_counter()
+    while True:
+        fn(rows)
+        done += len(rows)
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return done / elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="1000,10000,100000")
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    approaches = [
+        ("per-row models", per_row_models),
+        ("bulk adapter", bulk),
+        ("codec only", codec_only),
+    ]
+
+    print(f"codec: {codec.codec().name}")
+    print(f"{'approach':>16} {'rows':>8} {'rows/s':>12} {'speedup':>8}")
+    for count in (int(n) for n in args.rows.split(",")):
+        rows = make_rows(count)
+        baseline = None
+        for name, fn in approaches:
+            rate = rows_per_second(fn, rows, args.seconds)
+            baseline = baseline or rate
+            print(f"{name:>16} {count:>8} {rate:>12.0f} {rate / baseline:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,17 @@
 from ninja import NinjaAPI, Swagger
-from knoxtokens.auth import TokenAuthentication
+
+from bncapi import metrics
+from bncapi.renderers import CodecParser, CodecRenderer
 
 from users.api import user_router, auth_router
+from users.auth import CachedTokenAuthentication
 from games.api import game_router
 
 api = NinjaAPI(
-    auth=TokenAuthentication(), docs=Swagger(settings={"persistAuthorization": True})
+    auth=CachedTokenAuthentication(),
+    docs=Swagger(settings={"persistAuthorization": True}),
+    renderer=CodecRenderer(),
+    parser=CodecParser(),
 )
 
 
@@ -14,6 +20,11 @@ def ping(request):
     return {"message": "pong"}
 
 
+@api.get("/metrics", summary="Process metrics")
+def get_metrics(request):
+    return metrics.snapshot()
+
+
 api.add_router("/users", user_router)
 api.add_router("/auth", auth_router)
 api.add_router("/games", game_router)
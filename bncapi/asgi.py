@@ -16,6 +16,7 @@ from channels.security.websocket import AllowedHostsOriginValidator
 
 from games.middleware import TokenAuthMiddlewareStack
 from games import routing
+from bncapi.lifespan import lifespan_app
 
 
 django_asgi_app = get_asgi_application()
@@ -26,6 +27,8 @@ django_asgi_app = get_asgi_application()
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": URLRouter(routing.websocket_urlpatterns),
+    # flushes the actor engine's unwritten moves on shutdown
+    "lifespan": lifespan_app,
 })
 
 
@@ -0,0 +1,139 @@
+"""JSON codec shared by the WebSocket consumers, the action logger and the API.
+
+``JSON_CODEC`` selects the implementation: "stdlib", "orjson", "msgspec", or
+"auto" (the default) for orjson if it is installed, else the standard library.
+
+"stdlib" and "orjson" write the same JSON as Ninja's ``DjangoJSONEncoder``:
+datetimes in ECMA-262 format, e.g. ``2026-10-18T12:00:00.123Z``. "msgspec"
+writes them with microseconds (``...00.123456Z``), so clients must accept both
+before it is selected.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from pydantic import BaseModel
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, BaseModel):
+            return o.model_dump()
+        return super().default(o)
+
+
+_fallback = _Encoder()
+
+
+def _default(obj):
+    # types the fast encoders don't know natively (pydantic models, Decimal, ...)
+    return _fallback.default(obj)
+
+
+class JSONCodec:
+    name = "stdlib"
+
+    def dumps(self, obj) -> str:
+        return json.dumps(obj, cls=_Encoder, separators=(",", ":"))
+
+    def dumpb(self, obj) -> bytes:
+        return self.dumps(obj).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def dumps(self, obj) -> str:
+        return self.dumpb(obj).decode()
+
+    def dumpb(self, obj) -> bytes:
+        # datetimes go to _default too, to come out as DjangoJSONEncoder has them
+        orjson = self._orjson
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+    def loads(self, data):
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec(JSONCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._decode_error = msgspec.DecodeError
+        self._encoder = msgspec.json.Encoder(enc_hook=_default)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj) -> str:
+        return self.dumpb(obj).decode()
+
+    def dumpb(self, obj) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        try:
+            return self._decoder.decode(data)
+        except self._decode_error as e:
+            doc = data if isinstance(data, str) else data.decode(errors="replace")
+            raise json.JSONDecodeError(str(e), doc, 0) from e
+
+
+CODECS = {
+    JSONCodec.name: JSONCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgspecCodec.name: MsgspecCodec,
+}
+
+
+def get_codec(name: str = "auto") -> JSONCodec:
+    if name == "auto":
+        # not msgspec: its datetimes differ from the other two
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            return JSONCodec()
+
+    if name not in CODECS:
+        raise ImproperlyConfigured(
+            f"Unknown JSON_CODEC {name!r}, expected one of {sorted(CODECS)} or 'auto'"
+        )
+    return CODECS[name]()
+
+
+_codec = None
+
+
+def codec() -> JSONCodec:
+    global _codec
+    if _codec is None:
+        name = getattr(settings, "JSON_CODEC", "auto") if settings.configured else "auto"
+        _codec = get_codec(name)
+    return _codec
+
+
+def dumps(obj) -> str:
+    return codec().dumps(obj)
+
+
+def dumpb(obj) -> bytes:
+    return codec().dumpb(obj)
+
+
+def loads(data):
+    return codec().loads(data)
+
@@ -0,0 +1,112 @@
+"""ETag / Last-Modified support for polled GET operations.
+
+``conditional(stamp)`` asks ``stamp(request, **kwargs)`` for a cheap version
+marker of what the operation would return (a state version, a cache namespace
+generation, ``MAX(updated_at)``) before running it. When the client's
+``If-None-Match`` or ``If-Modified-Since`` shows it already has that version,
+the operation is skipped and a bodiless 304 is returned, so neither the full
+query nor serialization runs. Otherwise the operation runs and its response
+gets the ``ETag`` and ``Last-Modified`` headers.
+
+Like ``cached_response`` it wraps the view below the router decorator, after
+authentication. Placed above ``cached_response``, the stamp is part of the cache
+key, so a cached body is only served under the ETag computed with it. Operations must return an ``HttpResponse`` to get the headers.
+Stamps may be coroutine functions; async operations await them directly instead
+of handing them to a worker thread.
+"""
+import functools
+import hashlib
+import inspect
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from bncapi import response_cache
+
+
+def make_etag(request, token) -> str:
+    query = urlencode(sorted(request.GET.items()))
+    raw = f"{request.path}?{query}|{token}"
+    return "W/" + quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def _conditional_response(request, marker):
+    """``(etag, last_modified timestamp, 304 response or None)``."""
+    if marker is None:
+        return None, None, None
+    token, last_modified = marker
+    # cached_response keys the body on it too, so the two always match
+    request.conditional_stamp = token
+    etag = make_etag(request, token)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    return etag, timestamp, not_modified
+
+
+def _with_validators(response, etag, timestamp):
+    if isinstance(response, HttpResponse) and response.status_code == 200:
+        if etag:
+            response.headers["ETag"] = etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def namespace_stamp(*namespaces):
+    """Stamp from ``response_cache`` namespace generations; no database query.
+
+    None (no conditional handling) unless the generations live in a shared cache.
+    """
+
+    async def stamp(request, *args, **kwargs):
+        if not response_cache.is_shared():
+            return None
+        generations = await response_cache.agenerations(namespaces)
+        return ".".join(str(generation) for generation in generations), None
+
+    return stamp
+
+
+def conditional(stamp):
+    """``stamp(request, **kwargs) -> (token, last_modified or None) | None``.
+
+    ``None`` skips conditional handling for that request (e.g. a missing room,
+    so the operation can answer 404 itself).
+    """
+
+    stamp_is_async = inspect.iscoroutinefunction(stamp)
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            astamp = stamp if stamp_is_async else sync_to_async(stamp)
+
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                marker = await astamp(request, *args, **kwargs)
+                etag, timestamp, not_modified = _conditional_response(request, marker)
+                if not_modified is not None:
+                    return not_modified
+                response = await view(request, *args, **kwargs)
+                return _with_validators(response, etag, timestamp)
+
+            return async_wrapper
+
+        sync_stamp = async_to_sync(stamp) if stamp_is_async else stamp
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            marker = sync_stamp(request, *args, **kwargs)
+            etag, timestamp, not_modified = _conditional_response(request, marker)
+            if not_modified is not None:
+                return not_modified
+            response = view(request, *args, **kwargs)
+            return _with_validators(response, etag, timestamp)
+
+        return wrapper
+
+    return decorator
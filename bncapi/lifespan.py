@@ -0,0 +1,30 @@
+"""ASGI lifespan: what must happen before the server process exits.
+
+Servers that speak the lifespan protocol (uvicorn, including its gunicorn
+worker) send ``lifespan.shutdown`` once connections are closed. The actor game
+engine keeps accepted moves in memory for up to ``GAME_ENGINE_FLUSH_INTERVAL``
+seconds, so they are written back here rather than lost on a redeploy.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def _shutdown():
+    from games import engine
+
+    try:
+        await engine.registry.flush_all()
+    except Exception as e:
+        logger.error(f"Flushing room actors on shutdown failed: {type(e).__name__}: {e}")
+
+
+async def lifespan_app(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await _shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,29 @@
+"""Process-local counters and gauges, served by ``GET /api/metrics``."""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def incr(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name: str, fn):
+    """Register a callable sampled whenever metrics are read."""
+    _gauges[name] = fn
+
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def snapshot() -> dict:
+    values = counters()
+    for name, fn in _gauges.items():
+        values[name] = fn()
+    return dict(sorted(values.items()))
@@ -0,0 +1,92 @@
+"""Keyset (cursor) pagination.
+
+A page is read with ``WHERE (a, b) < (last_a, last_b) ORDER BY a DESC, b DESC
+LIMIT n``, so the cost of a page does not grow with how deep into the result it
+is, unlike ``OFFSET``. The cursor handed to clients is the ordering key of the
+last row of the previous page, encoded as an opaque URL-safe string.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from ninja.errors import HttpError
+
+from bncapi import codec
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values) -> str:
+    # full isoformat: DjangoJSONEncoder would cut timestamps to milliseconds
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(codec.dumpb(values)).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, model, fields) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = codec.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError("cursor does not match the ordering")
+        return [
+            model._meta.get_field(field).to_python(value)
+            for field, value in zip(fields, values, strict=True)
+        ]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        raise HttpError(400, "Invalid cursor")
+
+
+def page_size(limit: int | None) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, cursor=None, limit=None, fields=("timestamp", "id")):
+    """One page of ``queryset`` in descending ``fields`` order.
+
+    ``queryset`` must select ``fields`` (when it is a ``.values()`` queryset) and
+    the last field must be unique. Returns ``(rows, next_cursor)``;
+    ``next_cursor`` is None on the last page.
+    """
+    limit = page_size(limit)
+    rows = list(_page_query(queryset, cursor, limit, fields))
+    return _split_page(rows, limit, fields)
+
+
+async def akeyset_page(queryset, cursor=None, limit=None, fields=("timestamp", "id")):
+    """``keyset_page`` for async operations, read with the async ORM."""
+    limit = page_size(limit)
+    rows = [row async for row in _page_query(queryset, cursor, limit, fields)]
+    return _split_page(rows, limit, fields)
+
+
+def _page_query(queryset, cursor, limit, fields):
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, fields)
+        queryset = queryset.filter(_after(fields, values))
+    # one extra row tells whether there is a next page
+    return queryset.order_by(*(f"-{field}" for field in fields))[: limit + 1]
+
+
+def _split_page(rows, limit, fields):
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        key = [last[field] for field in fields]
+    else:
+        key = [getattr(last, field) for field in fields]
+    return rows, encode_cursor(key)
+
+
+def _after(fields, values) -> Q:
+    # (a, b, c) < (x, y, z)  ==  a < x OR (a = x AND (b < y OR (b = y AND c < z)))
+    field, value = fields[0], values[0]
+    condition = Q(**{f"{field}__lt": value})
+    if len(fields) > 1:
+        condition |= Q(**{field: value}) & _after(fields[1:], values[1:])
+    return condition
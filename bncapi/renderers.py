@@ -0,0 +1,16 @@
+from ninja.parser import Parser
+from ninja.renderers import BaseRenderer
+
+from bncapi import codec
+
+
+class CodecRenderer(BaseRenderer):
+    media_type = "application/json"
+
+    def render(self, request, data, *, response_status):
+        return codec.dumpb(data)
+
+
+class CodecParser(Parser):
+    def parse_body(self, request):
+        return codec.loads(request.body)
@@ -0,0 +1,182 @@
+"""Response cache for read-heavy Ninja GET operations.
+
+``cached_response`` stores whatever an operation returns (a ready
+``HttpResponse`` or a schema object) in the Django cache named by
+``RESPONSE_CACHE_ALIAS``: local memory by default, or Redis when
+``REDIS_CACHE_URL`` is set. It runs after Ninja's authentication, so a hit is
+only ever served to a request that passed it.
+
+Generations must be seen by every worker for an invalidation to reach them, so
+on a per-process cache (local memory, or the dummy cache) nothing is cached and
+``is_shared()`` is False; ``namespace_stamp`` then gives no ETags either.
+
+Keys combine the path, the sorted query string, the auth scope (anonymous,
+authenticated, or the user id for ``per_user`` operations) and the current
+generation of every namespace the response depends on, plus the stamp of an
+enclosing ``conditional``. ``invalidate(namespace)``
+bumps a generation, which orphans every entry built from the old one; orphans
+age out with their TTL. Hits and misses are counted per namespace set in
+``bncapi.metrics``.
+"""
+import functools
+import hashlib
+import inspect
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from bncapi import metrics
+
+CACHE_ALIAS = getattr(settings, "RESPONSE_CACHE_ALIAS", "default")
+CACHE_TTL = getattr(settings, "RESPONSE_CACHE_TTL", 30)
+
+# namespaces invalidated by model signals and by the writers that bypass them
+ROOMS = "rooms"
+USERS = "users"
+LEADERBOARD = "leaderboard"
+
+_GENERATION_PREFIX = "resp-gen"
+_ENTRY_PREFIX = "resp"
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def is_shared(alias=CACHE_ALIAS) -> bool:
+    """Whether every worker process reads and writes the same ``alias`` cache."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def _generation_keys(namespaces) -> list:
+    return [f"{_GENERATION_PREFIX}:{namespace}" for namespace in namespaces]
+
+
+def _fresh_generation() -> int:
+    # never reuses a number an evicted counter may have held
+    return time.time_ns()
+
+
+def generations(namespaces) -> list:
+    cache = _cache()
+    keys = _generation_keys(namespaces)
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _fresh_generation(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+async def agenerations(namespaces) -> list:
+    cache = _cache()
+    keys = _generation_keys(namespaces)
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, _fresh_generation(), timeout=None)
+            found[key] = await cache.aget(key)
+    return [found[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    cache = _cache()
+    for key in _generation_keys(namespaces):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_generation(), timeout=None)
+    metrics.incr("response_cache.invalidations", len(namespaces))
+
+
+def _scope(request, per_user) -> str:
+    auth = getattr(request, "auth", None)
+    if not auth:
+        return "anon"
+    if not per_user:
+        return "auth"
+    user = auth[0] if isinstance(auth, tuple) else auth
+    return f"user:{user.pk}"
+
+
+def cache_key(request, versions, per_user=False) -> str:
+    query = urlencode(sorted(request.GET.items()))
+    versions = ".".join(str(version) for version in versions)
+    raw = f"{request.path}?{query}|{_scope(request, per_user)}|{versions}"
+    return f"{_ENTRY_PREFIX}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def _versions(request, generations) -> list:
+    # the stamp conditional() made the ETag from, so the body matches it
+    stamp = getattr(request, "conditional_stamp", None)
+    return generations if stamp is None else [*generations, stamp]
+
+
+def _record(namespaces, hit):
+    name = "+".join(namespaces)
+    metrics.incr(f"response_cache.{'hit' if hit else 'miss'}.{name}")
+    metrics.incr(f"response_cache.{'hit' if hit else 'miss'}")
+
+
+def _cacheable(result) -> bool:
+    return result is not None and getattr(result, "status_code", 200) == 200
+
+
+def hit_ratio() -> float:
+    values = metrics.counters()
+    hits = values.get("response_cache.hit", 0)
+    total = hits + values.get("response_cache.miss", 0)
+    return round(hits / total, 4) if total else 0.0
+
+
+def cached_response(*namespaces, ttl=CACHE_TTL, per_user=False):
+    """Cache a GET operation's result until ``ttl`` or a namespace is invalidated.
+
+    Place it below the router decorator so it wraps the view Ninja calls.
+    """
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not is_shared():
+                    return await view(request, *args, **kwargs)
+                versions = _versions(request, await agenerations(namespaces))
+                key = cache_key(request, versions, per_user)
+                cached = await _cache().aget(key)
+                _record(namespaces, cached is not None)
+                if cached is not None:
+                    return cached
+                result = await view(request, *args, **kwargs)
+                if _cacheable(result):
+                    await _cache().aset(key, result, ttl)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_shared():
+                return view(request, *args, **kwargs)
+            versions = _versions(request, generations(namespaces))
+            key = cache_key(request, versions, per_user)
+            cached = _cache().get(key)
+            _record(namespaces, cached is not None)
+            if cached is not None:
+                return cached
+            result = view(request, *args, **kwargs)
+            if _cacheable(result):
+                _cache().set(key, result, ttl)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+metrics.gauge("response_cache.hit_ratio", hit_ratio)
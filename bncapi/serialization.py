@@ -0,0 +1,68 @@
+"""Bulk JSON responses straight from ``.values()`` rows.
+
+Returning model instances from a list endpoint builds one pydantic model per
+row, which Ninja then validates and dumps again before encoding. Here a
+``TypeAdapter`` over a TypedDict with the schema's fields is compiled once per
+schema; it coerces and encodes a whole list of row dicts in pydantic-core
+without creating any model objects. The endpoint keeps its ``response=`` schema
+for the OpenAPI docs and returns the ready ``HttpResponse``, which Ninja passes
+through untouched.
+"""
+from functools import lru_cache
+from typing import TypedDict
+
+from django.http import HttpResponse
+from pydantic import TypeAdapter
+
+from bncapi import codec
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+@lru_cache(maxsize=None)
+def _row_type(schema) -> type:
+    """TypedDict with the fields and types of ``schema``."""
+    return TypedDict(
+        f"{schema.__name__}Row",
+        {name: field.annotation for name, field in schema.model_fields.items()},
+    )
+
+
+@lru_cache(maxsize=None)
+def row_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(_row_type(schema))
+
+
+@lru_cache(maxsize=None)
+def rows_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(list[_row_type(schema)])
+
+
+def dump_rows(schema, rows) -> bytes:
+    """Encode ``rows`` (dicts keyed by ``schema``'s field names) as a JSON array."""
+    adapter = rows_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(list(rows)))
+
+
+def rows_response(schema, rows) -> HttpResponse:
+    return HttpResponse(dump_rows(schema, rows), content_type=JSON_CONTENT_TYPE)
+
+
+def object_response(schema, row) -> HttpResponse:
+    adapter = row_adapter(schema)
+    body = adapter.dump_json(adapter.validate_python(row))
+    return HttpResponse(body, content_type=JSON_CONTENT_TYPE)
+
+
+def page_response(schema, rows, next_cursor) -> HttpResponse:
+    """``{"items": [...], "next_cursor": ...}`` for a keyset page."""
+    body = b"".join(
+        (
+            b'{"items":',
+            dump_rows(schema, rows),
+            b',"next_cursor":',
+            codec.dumpb(next_cursor),
+            b"}",
+        )
+    )
+    return HttpResponse(body, content_type=JSON_CONTENT_TYPE)
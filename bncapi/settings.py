@@ -171,6 +171,96 @@ else:
             },
         },
     }
+# JSON codec for websockets, activity data and API responses: "auto" (orjson if
+# installed, else "stdlib"), "stdlib", "orjson" or "msgspec"; msgspec writes
+# datetimes with microseconds instead of DjangoJSONEncoder's milliseconds
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+
+# game engine: "db" loads and saves the room on every move, "actor" keeps each
+# active room in memory and writes it back in the background
+GAME_ENGINE = os.getenv("GAME_ENGINE", "db")
+GAME_ENGINE_FLUSH_INTERVAL = float(os.getenv("GAME_ENGINE_FLUSH_INTERVAL", 1.0))
+GAME_ENGINE_IDLE_TIMEOUT = float(os.getenv("GAME_ENGINE_IDLE_TIMEOUT", 60.0))
+
+# game websocket: how long a connection trusts the user it resolved at connect
+WS_AUTH_REVALIDATE_SECONDS = int(os.getenv("WS_AUTH_REVALIDATE_SECONDS", 300))
+
+# cache backend for responses and tokens: local memory, or any Redis-compatible
+# server when REDIS_CACHE_URL is set. Local memory is per process, so with it
+# responses are not cached, GET endpoints give fewer ETags and room state
+# snapshots are short-lived
+REDIS_CACHE_URL = os.getenv("REDIS_CACHE_URL")
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# response cache for read-heavy GET endpoints (bncapi.response_cache)
+RESPONSE_CACHE_ALIAS = os.getenv("RESPONSE_CACHE_ALIAS", "default")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 30))
+
+# public room state served by GET /games/rooms/{id}/state, refreshed on each save;
+# a worker only refreshes its own local-memory cache, so there it is re-read from
+# the database after ROOM_STATE_CACHE_LOCAL_TTL seconds
+ROOM_STATE_CACHE_TTL = int(os.getenv("ROOM_STATE_CACHE_TTL", 300))
+ROOM_STATE_CACHE_LOCAL_TTL = int(os.getenv("ROOM_STATE_CACHE_LOCAL_TTL", 2))
+
+# deserialized GameState objects reused between moves (games.state_cache)
+GAME_STATE_CACHE_SIZE = int(os.getenv("GAME_STATE_CACHE_SIZE", 1000))
+GAME_STATE_CACHE_MAX_BYTES = int(os.getenv("GAME_STATE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+GAME_STATE_CACHE_IDLE = int(os.getenv("GAME_STATE_CACHE_IDLE", 300))
+
+# finished games moved to the columnar archive by the room sweeper or
+# `manage.py archive_games` (games.archive); a room's last game goes once it has
+# been finished this long
+GAME_ARCHIVE_DIR = Path(os.getenv("GAME_ARCHIVE_DIR", BASE_DIR / "archive"))
+GAME_ARCHIVE_AFTER = int(os.getenv("GAME_ARCHIVE_AFTER", 24 * 60 * 60))
+GAME_ARCHIVE_BATCH_SIZE = int(os.getenv("GAME_ARCHIVE_BATCH_SIZE", 500))
+
+# room lifecycle (games.reaper): rooms without players for ROOM_IDLE_AFTER
+# seconds are archived, and deleted ROOM_EXPIRE_AFTER seconds later once their
+# games are in the archive; 0 disables the in-process sweeper. The sweeper also
+# archives games unless ROOM_REAPER_ARCHIVE_GAMES is "false", which workers that
+# don't share GAME_ARCHIVE_DIR need, with `manage.py archive_games` scheduled
+# in one place instead
+ROOM_IDLE_AFTER = int(os.getenv("ROOM_IDLE_AFTER", 60 * 60))
+ROOM_EXPIRE_AFTER = int(os.getenv("ROOM_EXPIRE_AFTER", 7 * 24 * 60 * 60))
+ROOM_REAPER_INTERVAL = int(os.getenv("ROOM_REAPER_INTERVAL", 300))
+ROOM_REAPER_BATCH_SIZE = int(os.getenv("ROOM_REAPER_BATCH_SIZE", 500))
+ROOM_REAPER_ARCHIVE_GAMES = (
+    os.getenv("ROOM_REAPER_ARCHIVE_GAMES", "true").lower() == "true"
+)
+
+# knox token verification cache: TOKEN_CACHE_ALIAS names a CACHES entry shared
+# by all workers, whose entries expire after TOKEN_CACHE_TTL seconds (or at
+# token expiry). Without one, each worker caches tokens for
+# TOKEN_CACHE_LOCAL_TTL seconds, which is also how long a logged-out token is
+# still accepted by the other workers.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+TOKEN_CACHE_LOCAL_TTL = int(os.getenv("TOKEN_CACHE_LOCAL_TTL", 10))
+TOKEN_CACHE_ALIAS = os.getenv("TOKEN_CACHE_ALIAS") or None
+
+# password hashing process pool (users.hashing); hashes beyond
+# PASSWORD_HASH_MAX_PENDING are refused with 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+# activity stream writer: actions are queued and bulk-inserted in the background
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", 100))
+ACTIVITY_FLUSH_INTERVAL_MS = int(os.getenv("ACTIVITY_FLUSH_INTERVAL_MS", 200))
+ACTIVITY_QUEUE_SIZE = int(os.getenv("ACTIVITY_QUEUE_SIZE", 10000))
+ACTIVITY_OVERFLOW = os.getenv("ACTIVITY_OVERFLOW", "drop_newest")
+
 # postgres
 POSTGRES_DATABASE_URL = os.getenv("POSTGRES_DATABASE_URL")
 if POSTGRES_DATABASE_URL:
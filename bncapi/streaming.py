@@ -0,0 +1,78 @@
+"""Newline-delimited JSON exports streamed straight from a database cursor.
+
+Rows are fetched ``EXPORT_CHUNK_SIZE`` at a time with ``QuerySet.aiterator``
+(a server-side cursor on PostgreSQL), encoded one JSON object per line and
+written out in ~64 KiB pieces, so memory use does not depend on the size of the
+result. Exports are ordered by ``id``; a client that lost its connection passes
+the last id it received as ``after_id`` to pick up where it stopped.
+
+``transform``, if given, is awaited with each chunk of rows and returns the
+rows to write, so related data can be added with one query per chunk.
+"""
+import zlib
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from bncapi import codec
+
+EXPORT_CHUNK_SIZE = getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+_WRITE_SIZE = 64 * 1024
+
+
+def ndjson_response(
+    request, queryset, after_id=None, chunk_size=EXPORT_CHUNK_SIZE, transform=None
+) -> StreamingHttpResponse:
+    """Stream a ``.values()`` queryset as NDJSON, gzipped if the client accepts it."""
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    queryset = queryset.order_by("id")
+
+    content = _ndjson_lines(queryset, chunk_size, transform)
+    compress = "gzip" in request.headers.get("Accept-Encoding", "")
+    if compress:
+        content = _gzipped(content)
+
+    response = StreamingHttpResponse(content, content_type=NDJSON_CONTENT_TYPE)
+    response["Vary"] = "Accept-Encoding"
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    return response
+
+
+async def _chunks(queryset, chunk_size):
+    rows = []
+    async for row in queryset.aiterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+async def _ndjson_lines(queryset, chunk_size, transform):
+    buffer = bytearray()
+    async for rows in _chunks(queryset, chunk_size):
+        if transform is not None:
+            rows = await transform(rows)
+        for row in rows:
+            buffer += codec.dumpb(row)
+            buffer += b"\n"
+            if len(buffer) >= _WRITE_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _gzipped(chunks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
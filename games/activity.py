@@ -0,0 +1,261 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Any, NamedTuple
+
+from actstream.models import Action
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from bncapi import codec, metrics, response_cache
+from knoxtokens.models import KnoxToken
+from users.models import UserStats, UserStatsBucket
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, "ACTIVITY_BATCH_SIZE", 100)
+FLUSH_INTERVAL_MS = getattr(settings, "ACTIVITY_FLUSH_INTERVAL_MS", 200)
+QUEUE_SIZE = getattr(settings, "ACTIVITY_QUEUE_SIZE", 10000)
+# "drop_newest" rejects the incoming event, "drop_oldest" evicts the oldest queued
+OVERFLOW = getattr(settings, "ACTIVITY_OVERFLOW", "drop_newest")
+
+# verbs counted into the leaderboard
+STAT_WON = "won_game"
+STAT_JOINED = "joined_room"
+# seconds between deletions of leaderboard buckets no window reads any more
+BUCKET_PRUNE_INTERVAL = 3600
+
+
+class ActivityEvent(NamedTuple):
+    verb: str
+    room: Any
+    data: dict | None
+    token: str | None
+    user: Any
+    timestamp: Any
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class ActivityWriter:
+    """Buffers activity-stream actions in memory and bulk-inserts them.
+
+    ``record`` never blocks or touches the database: events go into a bounded
+    queue, and a background thread resolves their tokens in one query per batch
+    and writes the batch with ``Action.objects.bulk_create`` once it holds
+    BATCH_SIZE events or its oldest event is FLUSH_INTERVAL_MS old. Whatever is
+    still queued is written on interpreter shutdown.
+
+    The leaderboard totals in ``UserStats`` and the time buckets in
+    ``UserStatsBucket`` are updated in the same transaction as the actions they
+    count.
+    """
+
+    def __init__(
+        self,
+        batch_size=BATCH_SIZE,
+        flush_interval_ms=FLUSH_INTERVAL_MS,
+        queue_size=QUEUE_SIZE,
+        overflow=OVERFLOW,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow = overflow
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        # once, not per thread start: stop() is a no-op without a live thread
+        atexit.register(self.stop)
+
+    def record(self, verb, room=None, data=None, token=None, user=None) -> bool:
+        self._ensure_started()
+        event = ActivityEvent(verb, room, data, token, user, timezone.now())
+
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            metrics.incr("activity.dropped")
+            if self.overflow != "drop_oldest":
+                return False
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait(event)
+            except (queue.Empty, queue.Full):
+                return False
+
+        metrics.incr("activity.enqueued")
+        return True
+
+    def flush(self, timeout=None):
+        """Block until every event recorded so far has been written."""
+        if not self._thread or not self._thread.is_alive():
+            return
+        marker = _Flush()
+        self._queue.put(marker)
+        marker.done.wait(timeout)
+
+    def stop(self, timeout=5):
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="activity-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, _Flush):
+                self._write(batch)
+                batch = []
+                item.done.set()
+                continue
+
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if batch and (
+                len(batch) >= self.batch_size or time.monotonic() >= deadline
+            ):
+                self._write(batch)
+                batch = []
+
+    def _write(self, events):
+        if not events:
+            return
+
+        close_old_connections()
+        try:
+            actions = self._build_actions(events)
+            with transaction.atomic():
+                Action.objects.bulk_create(actions, batch_size=self.batch_size)
+                stat_events = self._stat_events(actions)
+                UserStats.objects.add(self._stat_totals(stat_events))
+                UserStatsBucket.objects.add(stat_events)
+            metrics.incr("activity.written", len(actions))
+            metrics.incr("activity.batches")
+            if stat_events:
+                response_cache.invalidate(response_cache.LEADERBOARD)
+            self._prune_buckets()
+        except Exception as e:
+            metrics.incr("activity.failed", len(events))
+            logger.error(
+                f"Error writing {len(events)} activity events: "
+                f"{type(e).__name__}: {e}",
+                exc_info=True,
+            )
+        finally:
+            close_old_connections()
+
+    def _build_actions(self, events) -> list:
+        from .utils import _get_action_description, _token_key
+
+        token_keys = {_token_key(e.token) for e in events if not e.user and e.token}
+        users_by_key = {}
+        if token_keys:
+            for knox_token in KnoxToken.objects.select_related("user").filter(
+                token_key__in=token_keys
+            ):
+                users_by_key[knox_token.token_key] = knox_token.user
+
+        user_type = ContentType.objects.get_for_model(get_user_model())
+        room_type = ContentType.objects.get_for_model(Room)
+
+        actions = []
+        for event in events:
+            user = event.user or users_by_key.get(_token_key(event.token))
+            if not user:
+                metrics.incr("activity.anonymous")
+                continue
+
+            # same rows action.send(user, verb=..., target/action_object=room) makes
+            new_action = Action(
+                actor_content_type=user_type,
+                actor_object_id=str(user.pk),
+                verb=event.verb,
+                description=_get_action_description(event.verb, event.room, user),
+                timestamp=event.timestamp,
+                public=True,
+            )
+            if event.room is not None:
+                if event.data:
+                    new_action.target_content_type = room_type
+                    new_action.target_object_id = str(event.room.pk)
+                else:
+                    new_action.action_object_content_type = room_type
+                    new_action.action_object_object_id = str(event.room.pk)
+            if event.data:
+                new_action.data = {"data": codec.dumps(event.data)}
+            actions.append(new_action)
+        return actions
+
+    @staticmethod
+    def _stat_events(actions) -> list:
+        """``(user_id, timestamp, games_won, rooms_joined)`` per counted action."""
+        return [
+            (
+                int(new_action.actor_object_id),
+                new_action.timestamp,
+                int(new_action.verb == STAT_WON),
+                int(new_action.verb == STAT_JOINED),
+            )
+            for new_action in actions
+            if new_action.verb in (STAT_WON, STAT_JOINED)
+        ]
+
+    @staticmethod
+    def _stat_totals(events) -> dict:
+        totals = {}
+        for user_id, _timestamp, won, joined in events:
+            total_won, total_joined = totals.get(user_id, (0, 0))
+            totals[user_id] = (total_won + won, total_joined + joined)
+        return totals
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        if now - self._last_prune < BUCKET_PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            UserStatsBucket.objects.prune()
+        except Exception as e:
+            logger.error(f"Error pruning leaderboard buckets: {type(e).__name__}: {e}")
+
+
+writer = ActivityWriter()
+metrics.gauge("activity.queue_depth", writer._queue.qsize)
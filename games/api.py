@@ -3,12 +3,26 @@ import json
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
-from ninja import Router
+from django.http import HttpResponse
+from ninja import Query, Router
 from ninja.errors import HttpError
-from .models import Room
-from .schemas import RoomSchema, CreateRoomSchema
-from knoxtokens.auth import async_token_auth
-from bncpy.bnc.utils import get_random_number, get_random_number_async
+from .models import GuessRecord, Room, history_row
+from . import snapshots
+from .schemas import (
+    RoomSchema,
+    CreateRoomSchema,
+    RoomFilterSchema,
+    RoomPageSchema,
+    RoomStateSchema,
+)
+from bncapi import codec, response_cache
+from bncapi.pagination import DEFAULT_PAGE_SIZE, akeyset_page
+from bncapi.conditional import conditional, namespace_stamp
+from bncapi.response_cache import cached_response
+from bncapi.serialization import JSON_CONTENT_TYPE, object_response, page_response
+from bncapi.streaming import ndjson_response
+from users.auth import async_cached_token_auth
+from bncpy.bnc.utils import get_random_number_async
 from actstream import action
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
@@ -20,85 +34,170 @@ import logging
 logger = logging.getLogger(__name__)
 game_router = Router(tags=["Games"])
 
+# everything but secret_code; game_state goes out as public_state() has it
+ROOM_EXPORT_FIELDS = (
+    "id",
+    "name",
+    "game_type",
+    "code_length",
+    "num_of_colors",
+    "num_of_guesses",
+    "created_at",
+    "created_by_id",
+    "state_version",
+    "game_number",
+    "game_state",
+)
 
-@game_router.get("/rooms", response=list[RoomSchema], summary="List all rooms")
-def list_rooms(request):
-    return [RoomSchema.from_orm(room) for room in Room.objects.all().order_by("id").reverse()]
 
+async def _public_game_states(rows):
+    # as GET /rooms/{id}/state shows them: public_state(), with the guesses the
+    # stored game_state lacks put back from one GuessRecord read per chunk
+    pending = [
+        row
+        for row in rows
+        if isinstance(row["game_state"], dict) and "guesses" not in row["game_state"]
+    ]
+    histories = {}
+    async for room_id, game_number, *fields in GuessRecord.objects.of_games(
+        (row["id"], row["game_number"]) for row in pending
+    ):
+        histories.setdefault((room_id, game_number), []).append(history_row(*fields))
+    for row in pending:
+        row["game_state"] = {
+            **row["game_state"],
+            "guesses": histories.get((row["id"], row["game_number"]), []),
+        }
+    for row in rows:
+        if isinstance(row["game_state"], dict):
+            row["game_state"] = snapshots.public_state(row["game_state"])
+    return rows
 
-@game_router.post(
-    "/rooms-async",
-    auth=async_token_auth,
-    response=RoomSchema,
-    summary="Create a new room async",
+
+def _filtered_rooms(filters):
+    rooms = Room.objects.all()
+    if filters:
+        rooms = filters.filter(rooms)
+    if not filters or filters.status is None:
+        # the lobby grows with the live rooms, not every room ever created
+        rooms = rooms.filter(status__in=Room.LIVE_STATUSES)
+    return rooms
+
+
+def _room_stamp(request, room_id, **kwargs):
+    row = Room.objects.filter(id=room_id).values_list("state_version", "updated_at")
+    row = row.first()
+    if row is None:
+        return None
+    state_version, updated_at = row
+    return f"{state_version}:{updated_at}", updated_at
+
+
+def _load_room_state(request, room_id):
+    # once per request: the stamp and the operation both need it
+    if not hasattr(request, "room_state"):
+        request.room_state = snapshots.load(room_id)
+    return request.room_state
+
+
+def _room_state_stamp(request, room_id, **kwargs):
+    snapshot = _load_room_state(request, room_id)
+    if snapshot is None:
+        return None
+    return str(snapshot["version"]), None
+
+
+@game_router.get(
+    "/rooms",
+    response=RoomPageSchema,
+    summary="List rooms",
+    auth=async_cached_token_auth,
 )
-async def create_room_async(request, data: CreateRoomSchema):
-    if not request.auth or len(request.auth) < 1:
-        raise HttpError(401, "Authentication required")
+@conditional(namespace_stamp(response_cache.ROOMS))
+@cached_response(response_cache.ROOMS)
+async def list_rooms(
+    request,
+    filters: Query[RoomFilterSchema] = None,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    # newest first; never selects game_state
+    rooms = _filtered_rooms(filters)
 
-    _user = request.auth[0]
-    validated_data = data.dict()
+    rows, next_cursor = await akeyset_page(
+        rooms.values(*RoomSchema.Meta.fields), cursor, limit, fields=("id",)
+    )
+    return page_response(RoomSchema, rows, next_cursor)
 
-    validated_data["secret_code"] = await get_random_number_async(
-        length=validated_data["code_length"],
-        max_value=validated_data["num_of_colors"],
+
+@game_router.get(
+    "/rooms/{room_id}/state",
+    response=RoomStateSchema,
+    summary="Get a room's current game state",
+)
+@conditional(_room_state_stamp)
+def get_room_state(request, room_id: int):
+    # read-only: served from the state cache, never joins or writes the room
+    snapshot = _load_room_state(request, room_id)
+    if snapshot is None:
+        raise HttpError(404, "Room not found")
+    return HttpResponse(
+        codec.dumpb({"room_id": room_id, **snapshot}), content_type=JSON_CONTENT_TYPE
     )
-    validated_data["created_by"] = _user
-    try:
-        room = await database_sync_to_async(Room.objects.create)(**validated_data)
 
-        await database_sync_to_async(action.send)(
-            _user,
-            verb="created room",
-            target=room,
-            data=json.dumps(
-                {
-                    "id": room.id,
-                    "name": room.name,
-                    "game_type": room.game_type,
-                }
-            ),
-        )
 
-        return RoomSchema.from_orm(room)
-    except ValidationError as e:
-        logger.error(f"Room creation validation error: {e}")
-        raise HttpError(400, "Invalid room configuration")
-    except IntegrityError as e:
-        logger.error(f"Room creation integrity error: {e}")
-        raise HttpError(409, "Room with this configuration already exists")
-    except Exception as e:
-        logger.error(f"Unexpected room creation error: {e}")
-        raise HttpError(500, "Internal server error")
+@game_router.get(
+    "/rooms/export",
+    summary="Export rooms and their game history as NDJSON",
+    auth=async_cached_token_auth,
+)
+async def export_rooms(request, after_id: int | None = None):
+    # one JSON object per line in id order; resume with after_id=<last id seen>
+    return ndjson_response(
+        request,
+        Room.objects.values(*ROOM_EXPORT_FIELDS),
+        after_id,
+        transform=_public_game_states,
+    )
 
 
-@game_router.post("/rooms", response=RoomSchema, summary="Create a new room")
-def create_room(request, data: CreateRoomSchema):
+@game_router.post(
+    "/rooms",
+    response=RoomSchema,
+    summary="Create a new room",
+    auth=async_cached_token_auth,
+)
+async def create_room(request, data: CreateRoomSchema):
     if not request.auth or len(request.auth) < 1:
         raise HttpError(401, "Authentication required")
 
     _user = request.auth[0]
     validated_data = data.dict()
 
-    validated_data["secret_code"] = get_random_number(
+    validated_data["secret_code"] = await get_random_number_async(
         length=validated_data["code_length"],
         max_value=validated_data["num_of_colors"],
     )
     validated_data["created_by"] = _user
     try:
-        room = Room.objects.create(**validated_data)
+        room = await Room.objects.acreate(**validated_data)
         if hasattr(request, "session"):
-            request.session["user"] = {
-                "id": _user.id,
-                "email": _user.email,
-                "username": _user.username,
-            }
+            await request.session.aset(
+                "user",
+                {
+                    "id": _user.id,
+                    "email": _user.email,
+                    "username": _user.username,
+                },
+            )
         log_data = {
             "id": room.id,
             "name": room.name,
             "game_type": room.game_type,
         }
-        action.send(_user, verb="created room", target=room, data=json.dumps(log_data))
+        await database_sync_to_async(action.send)(
+            _user, verb="created room", target=room, data=json.dumps(log_data)
+        )
         return RoomSchema.from_orm(room)
     except ValidationError as e:
         logger.error(f"Room creation validation error: {e}")
@@ -116,6 +215,17 @@ def create_room(request, data: CreateRoomSchema):
 ######################################################################################
 
 
+# deprecated: same operation as POST /rooms
+game_router.post(
+    "/rooms-async",
+    response=RoomSchema,
+    summary="Create a new room async",
+    auth=async_cached_token_auth,
+    operation_id="create_room_async",
+    deprecated=True,
+)(create_room)
+
+
 # deprecated
 @game_router.get(
     "/rooms/{room_id}",
@@ -123,18 +233,12 @@ def create_room(request, data: CreateRoomSchema):
     summary="Get room by ID",
     deprecated=True,
 )
+@conditional(_room_stamp)
+@cached_response(response_cache.ROOMS)
 def get_room(request, room_id: int):
     try:
-        room = Room.objects.get(id=room_id)
-        return RoomSchema(
-            id=room.id,
-            name=room.name,
-            game_type=room.game_type,
-            code_length=room.code_length,
-            num_of_colors=room.num_of_colors,
-            num_of_guesses=room.num_of_guesses,
-            secret_code=room.secret_code,
-        )
+        room = Room.objects.values(*RoomSchema.Meta.fields).get(id=room_id)
+        return object_response(RoomSchema, room)
     except Room.DoesNotExist:
         raise HttpError(404, "Room not found")
     except Exception as e:
@@ -8,3 +8,5 @@ class GamesConfig(AppConfig):
     def ready(self):
         from actstream import registry
         registry.register(self.get_model('Room'))
+
+        from . import signals  # noqa: F401
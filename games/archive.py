@@ -0,0 +1,417 @@
+"""Finished games, moved out of the database into a columnar on-disk archive.
+
+A game is archived once it can no longer change: a reset has filed it under an
+earlier ``game_number``, or its room has been finished for longer than
+``GAME_ARCHIVE_AFTER`` seconds (``close_finished_games`` then moves the room on
+to a new game number). ``archive_games`` writes each such game to the shard of
+its config under ``GAME_ARCHIVE_DIR``, records it as a ``Game`` row (players,
+summary and position in the shard) and deletes its GuessRecord rows, all in one
+transaction.
+
+A shard is a directory ``<code_length>x<num_of_colors>`` holding two files of
+fixed-width little-endian records, ``GAME_FIELDS`` and ``GUESS_FIELDS``:
+
+- ``games.bin``: one record per game; its guesses are ``guess_count`` records
+  from ``first_guess`` in ``guesses.bin``
+- ``guesses.bin``: one record per guess, with the code packed four bits per
+  peg, first peg in the highest nibble, and the time since the game's first
+  guess
+
+``ArchiveShard`` maps both files with ``numpy.memmap`` (the ``archive`` extra),
+so scanning millions of games reads the files directly instead of the ORM.
+Files are only appended to, under an exclusive lock per shard. If the
+transaction fails they are cut back to their previous size; a crash between
+writing and committing can leave records whose ``game_id`` has no Game row.
+"""
+import fcntl
+import itertools
+import logging
+import os
+import re
+import struct
+from contextlib import ExitStack
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import snapshots
+from .models import Game, GuessRecord, Room
+from .state_cache import state_cache
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = getattr(settings, "GAME_ARCHIVE_DIR", settings.BASE_DIR / "archive")
+ARCHIVE_AFTER = getattr(settings, "GAME_ARCHIVE_AFTER", 24 * 60 * 60)
+BATCH_SIZE = getattr(settings, "GAME_ARCHIVE_BATCH_SIZE", 500)
+
+# (name, struct/numpy type code); both files are read back with these layouts
+GAME_FIELDS = (
+    ("game_id", "q"),
+    ("room_id", "q"),
+    ("game_number", "i"),
+    ("started_at", "q"),  # ms since the epoch, first guess
+    ("finished_at", "q"),  # ms since the epoch, last guess
+    ("first_guess", "Q"),
+    ("guess_count", "I"),
+    ("players", "H"),
+    ("won", "B"),
+)
+GUESS_FIELDS = (
+    ("game_id", "q"),
+    ("code", "Q"),
+    ("elapsed_ms", "Q"),
+    ("seq", "H"),
+    ("player", "H"),  # index into the Game row's participants
+    ("bulls", "B"),
+    ("cows", "B"),
+)
+GAME_RECORD = struct.Struct("<" + "".join(code for _name, code in GAME_FIELDS))
+GUESS_RECORD = struct.Struct("<" + "".join(code for _name, code in GUESS_FIELDS))
+
+# sixteen 4-bit pegs fill the 64-bit code field
+MAX_CODE_LENGTH = 16
+MAX_COLORS = 16
+
+_SHARD_NAME = re.compile(r"^(\d+)x(\d+)$")
+
+
+class _ConcurrentArchiveError(Exception):
+    """Another archiver deleted some of the rows first; the batch is rolled back."""
+
+
+def shard_name(code_length: int, num_of_colors: int) -> str:
+    return f"{code_length}x{num_of_colors}"
+
+
+def pack_code(code: str) -> int:
+    packed = 0
+    for peg in code:
+        packed = packed << 4 | int(peg, MAX_COLORS)
+    return packed
+
+
+def unpack_code(packed: int, code_length: int) -> str:
+    return "".join(
+        format(packed >> 4 * (code_length - 1 - i) & 0xF, "x")
+        for i in range(code_length)
+    )
+
+
+def _ms(value) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def close_finished_games(older_than=ARCHIVE_AFTER) -> int:
+    """Move rooms finished ``older_than`` seconds ago on to a new game number.
+
+    Their last game becomes archivable; the room keeps its final state, without
+    the guesses. The version bump makes any writer still holding the old state
+    reload it.
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    rooms = list(
+        Room.objects.filter(
+            status=Room.FINISHED, guess_count__gt=0, updated_at__lt=cutoff
+        ).values_list("id", "game_number")
+    )
+    closed = 0
+    for room_id, game_number in rooms:
+        # conditional on the room not having moved since the read above
+        closed += Room.objects.filter(
+            id=room_id,
+            status=Room.FINISHED,
+            game_number=game_number,
+            updated_at__lt=cutoff,
+        ).update(
+            game_number=game_number + 1,
+            guess_count=0,
+            state_version=F("state_version") + 1,
+        )
+        snapshots.forget(room_id)
+        state_cache.forget(room_id)
+    return closed
+
+
+def archive_games(batch_size=BATCH_SIZE, older_than=ARCHIVE_AFTER) -> int:
+    """Archive every game that can no longer change; returns how many."""
+    close_finished_games(older_than)
+
+    archived, after = 0, 0
+    while True:
+        room_ids = list(
+            GuessRecord.objects.filter(
+                game_number__lt=F("room__game_number"), room_id__gt=after
+            )
+            .values_list("room_id", flat=True)
+            .distinct()
+            .order_by("room_id")[:batch_size]
+        )
+        if not room_ids:
+            return archived
+        archived += _archive_rooms(room_ids)
+        after = room_ids[-1]
+
+
+def _archive_rooms(room_ids) -> int:
+    rooms = Room.objects.only(
+        "code_length", "num_of_colors", "created_by_id"
+    ).in_bulk(room_ids)
+    rows = (
+        GuessRecord.objects.filter(
+            room_id__in=room_ids, game_number__lt=F("room__game_number")
+        )
+        .order_by("room_id", "game_number", "seq")
+        .values_list(
+            "id", "room_id", "game_number", "seq", "player", "guess", "bulls",
+            "cows", "timestamp",
+        )
+    )
+
+    # shard -> [(room, game_number, rows)]
+    shards = {}
+    for (room_id, game_number), game_rows in itertools.groupby(
+        rows.iterator(), key=lambda row: (row[1], row[2])
+    ):
+        room = rooms[room_id]
+        game_rows = list(game_rows)
+        try:
+            _check_packable(room, game_number, game_rows)
+        except (ValueError, struct.error) as e:
+            # left in GuessRecord; the rest of the batch is archived
+            logger.warning(f"Not archiving game {game_number} of room {room_id}: {e}")
+            continue
+        key = (room.code_length, room.num_of_colors)
+        shards.setdefault(key, []).append((room, game_number, game_rows))
+
+    if not shards:
+        return 0
+
+    try:
+        with ExitStack() as stack, transaction.atomic():
+            # sorted, so two archivers can't each hold a lock the other waits for
+            writers = [
+                (stack.enter_context(ShardWriter(*key)), shards[key])
+                for key in sorted(shards)
+            ]
+
+            archived = []
+            for writer, games in writers:
+                index, first_guess = writer.game_count, writer.guess_count
+                for room, game_number, game_rows in games:
+                    game = _game_row(writer.name, index, room, game_number, game_rows)
+                    archived.append((writer, game, first_guess, game_rows))
+                    index += 1
+                    first_guess += len(game_rows)
+            Game.objects.bulk_create([game for _w, game, _f, _r in archived])
+
+            ids = [row[0] for *_rest, game_rows in archived for row in game_rows]
+            deleted, _by_model = GuessRecord.objects.filter(pk__in=ids).delete()
+            if deleted != len(ids):
+                raise _ConcurrentArchiveError
+
+            records = {}
+            for writer, game, first_guess, game_rows in archived:
+                game_records, guess_records = records.setdefault(writer, ([], []))
+                game_records.append(
+                    _game_record(game.pk, game, first_guess, game_rows)
+                )
+                guess_records.extend(_guess_records(game.pk, game, game_rows))
+            for writer, (game_records, guess_records) in records.items():
+                writer.append(game_records, guess_records)
+    except _ConcurrentArchiveError:
+        logger.warning(f"Rooms {room_ids[0]}..{room_ids[-1]} archived concurrently")
+        return 0
+
+    return len(archived)
+
+
+def _check_packable(room, game_number, game_rows):
+    """Raise ValueError or struct.error if the game doesn't fit the record layout."""
+    if room.code_length > MAX_CODE_LENGTH or room.num_of_colors > MAX_COLORS:
+        raise ValueError(
+            f"codes don't fit {MAX_CODE_LENGTH} pegs of {MAX_COLORS} colors"
+        )
+    for row in game_rows:
+        if len(row[5]) > MAX_CODE_LENGTH:
+            raise ValueError(f"guess {row[5]!r} is longer than {MAX_CODE_LENGTH} pegs")
+    # a dry run, so one bad game can't fail the whole batch's transaction
+    game = _game_row("", 0, room, game_number, game_rows)
+    _game_record(0, game, 0, game_rows)
+    for _record in _guess_records(0, game, game_rows):
+        pass
+
+
+def _game_row(shard, index, room, game_number, game_rows) -> Game:
+    participants = list(dict.fromkeys(row[4] for row in game_rows))
+    won = any(row[6] == room.code_length for row in game_rows)
+    return Game(
+        room_id=room.id,
+        participants=participants,
+        game_state={
+            "code_length": room.code_length,
+            "num_of_colors": room.num_of_colors,
+            "game_number": game_number,
+            "guesses": len(game_rows),
+            "game_won": won,
+            "archive": {"shard": shard, "index": index},
+        },
+        created_by_id=room.created_by_id,
+    )
+
+
+def _game_record(game_id, game, first_guess, game_rows) -> bytes:
+    return GAME_RECORD.pack(
+        game_id,
+        game.room_id,
+        game.game_state["game_number"],
+        _ms(game_rows[0][8]),
+        _ms(game_rows[-1][8]),
+        first_guess,
+        len(game_rows),
+        len(game.participants),
+        game.game_state["game_won"],
+    )
+
+
+def _guess_records(game_id, game, game_rows):
+    players = {player: i for i, player in enumerate(game.participants)}
+    started_at = _ms(game_rows[0][8])
+    for _id, _room_id, _game_number, seq, player, guess, bulls, cows, timestamp in (
+        game_rows
+    ):
+        yield GUESS_RECORD.pack(
+            game_id,
+            pack_code(guess),
+            max(0, _ms(timestamp) - started_at),
+            seq,
+            players[player],
+            bulls,
+            cows,
+        )
+
+
+class ShardWriter:
+    """Appends records to one shard while holding its lock."""
+
+    def __init__(self, code_length, num_of_colors, directory=None):
+        self.name = shard_name(code_length, num_of_colors)
+        self.path = Path(directory or ARCHIVE_DIR) / self.name
+        self.game_count = 0
+        self.guess_count = 0
+        self._lock = None
+
+    def __enter__(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = open(self.path / ".lock", "a")
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        # a torn record at the end, from a crash mid-write, is dropped
+        self.game_count = self._whole_records("games.bin", GAME_RECORD.size)
+        self.guess_count = self._whole_records("guesses.bin", GUESS_RECORD.size)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is not None:
+                self._truncate("games.bin", self.game_count * GAME_RECORD.size)
+                self._truncate("guesses.bin", self.guess_count * GUESS_RECORD.size)
+        finally:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+            self._lock.close()
+
+    def append(self, game_records, guess_records):
+        # guesses first: a game record never points past the end of guesses.bin
+        self._write("guesses.bin", guess_records)
+        self._write("games.bin", game_records)
+
+    def _whole_records(self, filename, size) -> int:
+        path = self.path / filename
+        length = path.stat().st_size if path.exists() else 0
+        if length % size:
+            self._truncate(filename, length - length % size)
+        return length // size
+
+    def _truncate(self, filename, length):
+        path = self.path / filename
+        if path.exists():
+            os.truncate(path, length)
+
+    def _write(self, filename, records):
+        with open(self.path / filename, "ab") as f:
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "Reading the game archive needs numpy: pip install 'bncapi[archive]'"
+        ) from e
+    return np
+
+
+def _dtype(np, fields):
+    return np.dtype([(name, "<" + code) for name, code in fields])
+
+
+class ArchiveShard:
+    """The archived games of one config, memory-mapped read-only.
+
+    ``games`` and ``guesses`` are numpy structured arrays with the fields of
+    ``GAME_FIELDS`` and ``GUESS_FIELDS``; pages are read from disk as they are
+    touched, so opening a shard costs nothing whatever its size.
+    """
+
+    def __init__(self, code_length, num_of_colors, directory=None):
+        np = _numpy()
+        self.code_length = code_length
+        self.num_of_colors = num_of_colors
+        self.path = Path(directory or ARCHIVE_DIR) / shard_name(
+            code_length, num_of_colors
+        )
+        self.games = self._map(np, "games.bin", _dtype(np, GAME_FIELDS))
+        self.guesses = self._map(np, "guesses.bin", _dtype(np, GUESS_FIELDS))
+
+    def _map(self, np, filename, dtype):
+        path = self.path / filename
+        count = path.stat().st_size // dtype.itemsize if path.exists() else 0
+        if not count:
+            # numpy can't map an empty file
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def __len__(self):
+        return len(self.games)
+
+    def game_guesses(self, index):
+        """The guess records of the game at ``index``, in play order."""
+        game = self.games[index]
+        first = int(game["first_guess"])
+        return self.guesses[first : first + int(game["guess_count"])]
+
+    def pegs(self, codes):
+        """Packed ``codes`` as an ``(n, code_length)`` array of peg values."""
+        np = _numpy()
+        shifts = 4 * np.arange(self.code_length - 1, -1, -1, dtype=np.uint64)
+        codes = np.asarray(codes, dtype=np.uint64)
+        return ((codes[:, None] >> shifts) & np.uint64(0xF)).astype(np.uint8)
+
+
+def shards(directory=None) -> list[ArchiveShard]:
+    """Every shard in the archive, ordered by config."""
+    path = Path(directory or ARCHIVE_DIR)
+    if not path.is_dir():
+        return []
+    configs = sorted(
+        (int(match[1]), int(match[2]))
+        for match in (_SHARD_NAME.match(entry.name) for entry in path.iterdir())
+        if match
+    )
+    return [ArchiveShard(*config, directory=directory) for config in configs]
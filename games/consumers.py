@@ -1,21 +1,29 @@
+import json
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .utils import log_user_action_async
 
-User = get_user_model()
+from bncapi import codec
+from . import engine, protocol
+from .reaper import reaper
+from .utils import _authenticate_user_async, log_user_action_async, token_group_name
 
-from .models import Room
-from .services import GameService
-import uuid
-import json
-import logging
-from django.conf import settings
-from channels.db import database_sync_to_async
-from urllib.parse import parse_qs
+User = get_user_model()
 
 TOKEN_KEY_LENGTH = getattr(settings, "TOKEN_KEY_LENGTH", 8)
+WS_AUTH_REVALIDATE_SECONDS = getattr(settings, "WS_AUTH_REVALIDATE_SECONDS", 300)
 logger = logging.getLogger(__name__)
 
+# room id -> (wire, updates) variants of this worker's connections, so a
+# broadcast only encodes the frames someone here will send
+_room_variants = defaultdict(Counter)
+
 
 class GameConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
@@ -24,6 +32,18 @@ class GameConsumer(AsyncWebsocketConsumer):
         self.room_group_name = None
         self.room = None
         self.token = None
+        # resolved once in connect and reused for the connection's lifetime
+        self.user = None
+        self.user_checked_at = None
+        self.token_group_name = None
+        self.updates = protocol.UPDATES_FULL
+        self.wire = protocol.WIRE_JSON
+        # last state this connection has seen, the base for outgoing deltas; kept
+        # as the encoded frame it arrived in and decoded only when needed
+        self.seq = None
+        self._state = None
+        self._state_frame = None
+        self._variant = None
 
     async def connect(self):
         try:
@@ -43,23 +63,24 @@ class GameConsumer(AsyncWebsocketConsumer):
             self.token = str(uuid.uuid4())
             logger.info(f"Generated new token for connection: {self.token[:8]}...")
 
-        try:
-            self.room = await database_sync_to_async(Room.objects.select_related().get)(
-                id=self.room_id
-            )
+        if query_params.get("updates", [None])[0] == protocol.UPDATES_DELTA:
+            self.updates = protocol.UPDATES_DELTA
+        if protocol.MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.wire = protocol.WIRE_MSGPACK
 
-            if not self.room.game_state:
-                await database_sync_to_async(self.room.initialize_game)()
-                logger.info(f"Initialized game state for room {self.room_id}")
+        # sweeps for idle rooms run on the event loop of any worker serving games
+        reaper.ensure_started()
 
-            game_state = await GameService.handle_move(
-                self.room_id,
-                {
-                    "action": "join_room",
-                    "token": self.token,
-                },
-                {"token": self.token},
+        try:
+            # one read and one write: an unplayed room is initialized with the join
+            room, game_state = await engine.join_room(
+                self.room_id, {"token": self.token}
             )
+            if room is None:
+                logger.warning(f"Room {self.room_id} not found")
+                await self.close(code=4004)
+                return
+            self.room = room
 
             if "error" in game_state:
                 logger.error(
@@ -69,23 +90,30 @@ class GameConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4000)
                 return
 
-            await self.accept()
+            if self.wire == protocol.WIRE_MSGPACK:
+                await self.accept(subprotocol=protocol.MSGPACK_SUBPROTOCOL)
+            else:
+                await self.accept()
 
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+            self._variant = (self.wire, self.updates)
+            _room_variants[self.room_id][self._variant] += 1
+
+            await self._authenticate()
+            self.token_group_name = token_group_name(self.token)
+            if self.user and self.token_group_name:
+                await self.channel_layer.group_add(
+                    self.token_group_name, self.channel_name
+                )
 
             logger.info(f"Player {self.token[:8]}... connected to room {self.room_id}")
 
-            await log_user_action_async(
-                token=self.token, room=self.room, user_action="joined_room"
-            )
+            await self._log_action("joined_room")
 
-            await self.send(
-                text_data=json.dumps({"type": "update", "state": game_state})
-            )
+            await self._send_snapshot(game_state)
+            # the joining connection has no base other players share
+            await self._broadcast(game_state, previous=None)
 
-        except Room.DoesNotExist:
-            logger.warning(f"Room {self.room_id} not found")
-            await self.close(code=4004)
         except Exception as e:
             logger.error(
                 f"Unexpected error connecting to room {self.room_id}: "
@@ -97,7 +125,7 @@ class GameConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         if self.room:
             logger.info(f"Player {self.token} disconnecting from room {self.room_id}")
-            await GameService.handle_move(
+            previous, game_state = await engine.handle_move(
                 self.room_id,
                 {
                     "action": "leave_room",
@@ -105,84 +133,160 @@ class GameConsumer(AsyncWebsocketConsumer):
                 },
                 {"token": self.token},
             )
-
-            await log_user_action_async(
-                token=self.token, room=self.room, user_action="left_room"
-            )
-
+            if "error" not in game_state and self.room_group_name:
+                await self._broadcast(game_state, previous=previous)
+
+            await self._log_action("left_room")
+
+        if self._variant is not None:
+            variants = _room_variants[self.room_id]
+            variants[self._variant] -= 1
+            if variants[self._variant] <= 0:
+                del variants[self._variant]
+            if not variants:
+                del _room_variants[self.room_id]
+            self._variant = None
         if self.room_group_name:
             await self.channel_layer.group_discard(
                 self.room_group_name, self.channel_name
             )
+        if self.user and self.token_group_name:
+            await self.channel_layer.group_discard(
+                self.token_group_name, self.channel_name
+            )
 
-    async def receive(self, text_data=None):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            if bytes_data is not None:
+                data = protocol.unpack(bytes_data)
+            else:
+                data = codec.loads(text_data)
             event_type = data.get("type")
             payload = data.get("payload", {})
 
             if event_type == "make_move":
                 payload["token"] = self.token
 
-                game_state = await GameService.handle_move(
+                previous, game_state = await engine.handle_move(
                     self.room_id,
                     payload,
                     {"token": self.token},
                 )
 
-                await log_user_action_async(
-                    token=self.token,
-                    room=self.room,
-                    user_action="guessed_code",
-                    data=payload,
-                )
+                await self._log_action("guessed_code", data=payload)
 
                 if game_state.get("game_won"):
-                    await log_user_action_async(
-                        token=self.token, room=self.room, user_action="won_game"
-                    )
+                    await self._log_action("won_game")
 
                 if "error" in game_state:
-                    await self.send(
-                        text_data=json.dumps(
-                            {"type": "error", "message": game_state["error"]}
-                        )
+                    await self._send_frame(
+                        {"type": "error", "message": game_state["error"]}
                     )
                     return
 
-                # broadcast updated state to all players in room
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "game_update",
-                        "state": game_state,
-                    },
-                )
+                # broadcast updated state to all players in room, as a delta
+                # from the room's state before the move, which they all saw
+                await self._broadcast(game_state, previous=previous)
+            elif event_type == "resync":
+                # the room's current state, not this connection's last-seen one:
+                # a resync is asked for after missing updates
+                game_state = await engine.room_state(self.room_id)
+                if game_state is None:
+                    await self._send_frame(
+                        {"type": "error", "message": "Room not found"}
+                    )
+                else:
+                    await self._send_snapshot(game_state)
             elif event_type == "ping":
-                await self.send(text_data=json.dumps({"type": "pong"}))
+                await self._send_frame({"type": "pong"})
 
             # TODO: add chat
             elif event_type == "chat_message":
                 pass
             else:
-                await self.send(
-                    text_data=json.dumps(
-                        {
-                            "type": "error",
-                            "message": f"Unknown event type: {event_type}",
-                        }
-                    )
+                await self._send_frame(
+                    {
+                        "type": "error",
+                        "message": f"Unknown event type: {event_type}",
+                    }
                 )
 
         except json.JSONDecodeError:
-            await self.send(
-                text_data=json.dumps({"type": "error", "message": "Invalid JSON"})
-            )
+            await self._send_frame({"type": "error", "message": "Invalid JSON"})
+        except protocol.FrameError:
+            await self._send_frame({"type": "error", "message": "Invalid frame"})
         except Exception as e:
-            await self.send(text_data=json.dumps({"type": "error", "message": str(e)}))
+            await self._send_frame({"type": "error", "message": str(e)})
+
+    async def _authenticate(self):
+        self.user = await _authenticate_user_async(self.token)
+        self.user_checked_at = time.monotonic()
+
+    async def _log_action(self, user_action, data=None):
+        if self.user_checked_at is None:
+            return
+        if time.monotonic() - self.user_checked_at >= WS_AUTH_REVALIDATE_SECONDS:
+            await self._authenticate()
+        # anonymous connections are never looked up again mid-game
+        if self.user:
+            await log_user_action_async(
+                token=self.token,
+                room=self.room,
+                user_action=user_action,
+                data=data,
+                user=self.user,
+            )
+
+    async def token_revoked(self, event):
+        logger.info(f"Token revoked for connection in room {self.room_id}")
+        self.user = None
+
+    @property
+    def state(self):
+        if self._state is None and self._state_frame is not None:
+            self._state = protocol.state_from_frame(self._state_frame)
+        return self._state
+
+    async def _broadcast(self, game_state, previous):
+        # encoded once here, whatever the number of players in the room, and
+        # only in the variants this worker's connections to it use
+        variants = list(_room_variants.get(self.room_id, ()))
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            protocol.broadcast_event(game_state, previous, variants=variants),
+        )
+
+    async def _send_snapshot(self, game_state):
+        self._remember(game_state.get("version"), state=game_state)
+        if self.updates == protocol.UPDATES_DELTA:
+            frame = protocol.snapshot_frame(game_state)
+        else:
+            frame = protocol.update_frame(game_state)
+        await self._send_frame(frame)
+
+    async def _send_frame(self, frame):
+        if self.wire == protocol.WIRE_MSGPACK:
+            await self.send(bytes_data=protocol.pack(frame))
+        else:
+            await self.send(text_data=codec.dumps(frame))
 
     async def game_update(self, event):
+        seq = event["seq"]
+        # updates can race through the channel layer; never step backwards
+        if self.seq is not None and (seq or 0) <= self.seq:
+            return
+
         # use from the client
-        await self.send(
-            text_data=json.dumps({"type": "update", "state": event["state"]})
+        frame = protocol.event_frame(
+            event, self.wire, self.updates, previous=lambda: self.state
+        )
+        if self.wire == protocol.WIRE_MSGPACK:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+        self._remember(
+            seq, frame=event["frames"][protocol.WIRE_JSON][protocol.UPDATES_FULL]
         )
+
+    def _remember(self, seq, state=None, frame=None):
+        self.seq, self._state, self._state_frame = seq, state, frame
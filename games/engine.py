@@ -0,0 +1,306 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from . import snapshots
+from .models import Room
+from .services import SAVE_ATTEMPTS, GameService
+
+logger = logging.getLogger(__name__)
+
+GAME_ENGINE = getattr(settings, "GAME_ENGINE", "db")
+FLUSH_INTERVAL = getattr(settings, "GAME_ENGINE_FLUSH_INTERVAL", 1.0)
+IDLE_TIMEOUT = getattr(settings, "GAME_ENGINE_IDLE_TIMEOUT", 60.0)
+
+
+class RoomActor:
+    """Single owner of a room's live GameState.
+
+    Moves are queued and applied in arrival order against the in-memory state, so
+    a move never waits on the database. The state is written back to
+    ``Room.game_state`` at most every FLUSH_INTERVAL seconds while dirty, right
+    away when a game ends, and a last time before the actor retires after
+    IDLE_TIMEOUT seconds without moves.
+
+    Writes are compare-and-swap on ``Room.state_version``. If another worker
+    saved the room in between, the actor reloads the row and replays the moves
+    it has not persisted yet, so neither side loses a guess.
+    """
+
+    def __init__(self, room_id, registry, previous=None):
+        self.room_id = room_id
+        self.room = None
+        self.state = None
+        self.version = None
+        # GuessRecord rows already written for the current game
+        self.game_number = 0
+        self.saved_guesses = 0
+        self.seq = None
+        self.snapshot = None
+        self.dirty = False
+        self._unflushed = []
+        self._registry = registry
+        self._previous = previous
+        self._queue = asyncio.Queue()
+        self._flush_task = None
+        self._last_flush = 0.0
+        self.task = asyncio.create_task(self._run())
+
+    def submit(self, payload, player_info) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((payload, player_info, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            if self._previous:
+                # wait for the retiring actor's final write before reading the row
+                await asyncio.wait([self._previous])
+            self.room, self.state, self.version = await self._load()
+            self.seq = self.version
+            self.game_number = self.room.game_number
+            self.saved_guesses = self.room.guess_count
+        except Exception as e:
+            error = (
+                {"error": "Room not found"}
+                if isinstance(e, Room.DoesNotExist)
+                else {"error": str(e)}
+            )
+            self._registry.retire(self)
+            self._fail_pending(error)
+            return
+
+        self._last_flush = loop.time()
+        last_move = loop.time()
+
+        while True:
+            now = loop.time()
+            if self.dirty and self._flushing():
+                timeout = FLUSH_INTERVAL
+            elif self.dirty:
+                timeout = max(0.0, self._last_flush + FLUSH_INTERVAL - now)
+            else:
+                timeout = max(0.0, last_move + IDLE_TIMEOUT - now)
+
+            try:
+                payload, player_info, future = await asyncio.wait_for(
+                    self._queue.get(), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                if self.dirty:
+                    self._schedule_flush()
+                elif loop.time() - last_move >= IDLE_TIMEOUT and self._queue.empty():
+                    break
+                continue
+
+            last_move = loop.time()
+            reset = payload.get("action") == "reset_game"
+            if reset and self.dirty:
+                # the guesses of the game being reset are filed under it first
+                await self.flush()
+            previous, result = self._apply(payload, player_info)
+            if not future.done():
+                future.set_result((previous, result))
+
+            if "error" in result:
+                continue
+            if GameService.is_game_over(result) or reset:
+                # a reset is written at once so _write_state sees the guesses
+                # start over and opens a new game number
+                await self.flush()
+            elif loop.time() - self._last_flush >= FLUSH_INTERVAL:
+                self._schedule_flush()
+
+        # no submit() can reach this actor once it is unregistered, so the final
+        # flush below sees every move it accepted
+        self._registry.retire(self)
+        await self.flush()
+        logger.info(f"Room actor {self.room_id} retired after idle timeout")
+
+    def _apply(self, payload, player_info) -> tuple[dict | None, dict]:
+        """``(previous, state)`` as ``handle_move`` returns them."""
+        try:
+            previous = self.snapshot or GameService.detached_state(self.state)
+            previous = {**previous, "version": self.seq}
+            error = GameService.apply_move(self.state, payload, player_info)
+            if error:
+                return None, error
+            self._unflushed.append((payload, player_info))
+            # detached: written back and handed out while later moves go on
+            self.snapshot = GameService.detached_state(self.state)
+            self.seq += 1
+            self.dirty = True
+            return previous, {**self.snapshot, "version": self.seq}
+        except Exception as e:
+            return None, {"error": str(e)}
+
+    def _fail_pending(self, error):
+        while not self._queue.empty():
+            _payload, _player_info, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_result((None, error))
+
+    @database_sync_to_async
+    def _load(self):
+        room = Room.objects.get(id=self.room_id)
+        return room, GameService._load_state(room), room.state_version
+
+    def _flushing(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+    def _schedule_flush(self):
+        if not self._flushing():
+            self._flush_task = asyncio.create_task(self._write())
+
+    async def flush(self):
+        """Write back the unsaved moves, replaying them over conflicting writes."""
+        if self._flushing():
+            await self._flush_task
+        for _attempt in range(SAVE_ATTEMPTS):
+            if not self.dirty:
+                return
+            await self._write()
+        if self.dirty:
+            logger.error(
+                f"Gave up writing room {self.room_id} after {SAVE_ATTEMPTS} attempts"
+            )
+
+    async def _write(self):
+        snapshot, moves = self.snapshot, self._unflushed
+        game_number, saved_guesses = self.game_number, self.saved_guesses
+        self._unflushed = []
+        self.dirty = False
+        self._last_flush = asyncio.get_running_loop().time()
+        try:
+            written = await database_sync_to_async(GameService._write_state)(
+                self.room_id,
+                snapshot,
+                self.state.config.secret_code,
+                self.version,
+                len(moves),
+                game_number=game_number,
+                saved_guesses=saved_guesses,
+                previous=(self.room.status, self.room.player_count),
+            )
+            if written is not None:
+                self.version += len(moves)
+                self.game_number, self.saved_guesses = written
+                self.room.status = Room.status_for(snapshot)
+                self.room.player_count = Room.player_count_for(snapshot)
+            else:
+                await self._rebase(moves)
+        except Exception as e:
+            self._unflushed = moves + self._unflushed
+            self.dirty = True
+            logger.error(
+                f"Write-behind for room {self.room_id} failed: "
+                f"{type(e).__name__}: {e}",
+                exc_info=True,
+            )
+
+    async def _rebase(self, moves):
+        logger.warning(f"Room {self.room_id} was written elsewhere, replaying moves")
+        room, state, version = await self._load()
+        # moves applied while the row was being reloaded are replayed as well
+        replay = moves + self._unflushed
+        self._unflushed = []
+        self.room, self.state, self.version = room, state, version
+        # clients drop updates whose seq isn't above the last one they saw, so
+        # the reload must not move it back to the (possibly lower) row version
+        self.seq = max(self.seq, version)
+        self.game_number, self.saved_guesses = room.game_number, room.guess_count
+        for payload, player_info in replay:
+            self._apply(payload, player_info)
+        self.snapshot = GameService.detached_state(self.state)
+        self.dirty = True
+
+
+class RoomActorRegistry:
+    def __init__(self):
+        self._actors = {}
+        self._retiring = {}
+
+    def actor(self, room_id) -> RoomActor:
+        actor = self._actors.get(room_id)
+        if actor is None:
+            actor = RoomActor(room_id, self, previous=self._retiring.get(room_id))
+            self._actors[room_id] = actor
+        return actor
+
+    def live(self, room_id) -> RoomActor | None:
+        """The room's actor if it is running with its state loaded."""
+        actor = self._actors.get(room_id)
+        if actor is None or actor.state is None:
+            return None
+        return actor
+
+    def submit(self, room_id, payload, player_info) -> asyncio.Future:
+        return self.actor(room_id).submit(payload, player_info)
+
+    def retire(self, actor):
+        if self._actors.get(actor.room_id) is actor:
+            del self._actors[actor.room_id]
+        self._retiring[actor.room_id] = actor.task
+        actor.task.add_done_callback(
+            lambda task, room_id=actor.room_id: self._forget(room_id, task)
+        )
+
+    def _forget(self, room_id, task):
+        if self._retiring.get(room_id) is task:
+            del self._retiring[room_id]
+
+    async def flush_all(self):
+        """Write back every actor's unsaved moves; run on server shutdown."""
+        await asyncio.gather(
+            *(actor.flush() for actor in list(self._actors.values())),
+            # retiring actors are finishing their last write
+            *list(self._retiring.values()),
+            return_exceptions=True,
+        )
+
+
+registry = RoomActorRegistry()
+
+
+async def handle_move(room_id, payload, player_info):
+    """Entry point for consumers; routes to the configured game engine.
+
+    Returns ``(previous, state)``, see ``GameService.handle_move``.
+    """
+    if GAME_ENGINE == "actor":
+        return await registry.submit(room_id, payload, player_info)
+    return await GameService.handle_move(room_id, payload, player_info)
+
+
+async def join_room(room_id, player_info):
+    """Load the room and join it: ``(room, state)``, room None if it doesn't exist.
+
+    The actor engine reads the room once when its actor starts; joining an
+    active room costs no query.
+    """
+    if GAME_ENGINE == "actor":
+        actor = registry.actor(room_id)
+        payload = {"action": "join_room", "token": player_info.get("token")}
+        _previous, state = await actor.submit(payload, player_info)
+        return actor.room, state
+    return await GameService.join_room(room_id, player_info)
+
+
+async def room_state(room_id) -> dict | None:
+    """The room's latest state with its version, as updates carry it; None if no room.
+
+    Under the actor engine a running actor holds moves not yet written, so its
+    state is the authoritative one; otherwise the stored snapshot is.
+    """
+    if GAME_ENGINE == "actor":
+        actor = registry.live(room_id)
+        if actor is not None:
+            state = actor.snapshot or actor.state.to_dict()
+            return {**state, "version": actor.seq}
+    snapshot = await database_sync_to_async(snapshots.load)(room_id)
+    if snapshot is None:
+        return None
+    return {**snapshot["state"], "version": snapshot["version"]}
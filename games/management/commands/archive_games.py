@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from games import archive
+
+
+class Command(BaseCommand):
+    help = "Move finished games out of the database into the columnar game archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=archive.ARCHIVE_AFTER,
+            help="archive the last game of rooms finished this many seconds ago",
+        )
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        archived = archive.archive_games(
+            batch_size=options["batch_size"], older_than=options["older_than"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {archived} games to {archive.ARCHIVE_DIR}")
+        )
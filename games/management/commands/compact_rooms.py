@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from games import reaper
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive idle rooms, move their games to the game archive and delete "
+        "rooms archived long enough ago"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--idle-after",
+            type=int,
+            default=reaper.IDLE_AFTER,
+            help="archive rooms without players for this many seconds",
+        )
+        parser.add_argument(
+            "--expire-after",
+            type=int,
+            default=reaper.EXPIRE_AFTER,
+            help="delete rooms archived this many seconds ago",
+        )
+        parser.add_argument("--batch-size", type=int, default=reaper.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        swept = reaper.sweep(
+            options["idle_after"],
+            options["expire_after"],
+            options["batch_size"],
+            archive_games=True,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {swept['archived']} idle rooms and {swept['games']} "
+                f"games, deleted {swept['expired']} expired rooms"
+            )
+        )
+        if swept["stuck"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{swept['stuck']} rooms past expiry still hold guesses that "
+                    "could not be archived"
+                )
+            )
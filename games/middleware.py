@@ -9,6 +9,7 @@ from channels.db import database_sync_to_async
 from channels.sessions import CookieMiddleware, SessionMiddleware
 from knoxtokens.auth import TokenAuthentication  # Changed from JWT
 
+from users.auth import token_cache
 from users.utils import CustomerAccountHandler
 
 User = get_user_model()
@@ -52,8 +53,13 @@ def get_user(scope):
         return AnonymousUser()
 
     try:
-        knox_auth = TokenAuthentication()
-        user, auth_token = knox_auth.authenticate(token[0].encode())
+        cached = token_cache.get(token[0])
+        if cached is not None:
+            user, auth_token = cached
+        else:
+            knox_auth = TokenAuthentication()
+            user, auth_token = knox_auth.authenticate(token[0].encode())
+            token_cache.set(token[0], user, auth_token)
 
         if not user or not user.is_active:
             logger.warning(
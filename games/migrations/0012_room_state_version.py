@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("games", "0011_remove_room_active_users_remove_room_updated_at_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="state_version",
+            field=models.IntegerField(default=0),
+        ),
+    ]
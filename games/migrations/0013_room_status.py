@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def set_finished_rooms(apps, schema_editor):
+    Room = apps.get_model("games", "Room")
+    finished = [
+        room_id
+        for room_id, game_state in Room.objects.values_list(
+            "id", "game_state"
+        ).iterator(chunk_size=2000)
+        if isinstance(game_state, dict)
+        and (game_state.get("game_won") or game_state.get("game_over"))
+    ]
+    for start in range(0, len(finished), 1000):
+        Room.objects.filter(id__in=finished[start : start + 1000]).update(
+            status="finished"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("games", "0012_room_state_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="status",
+            field=models.CharField(
+                choices=[("open", "Open"), ("finished", "Finished")],
+                default="open",
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(set_finished_rooms, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(fields=["status", "-id"], name="room_status_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(
+                fields=["game_type", "status", "-id"], name="room_type_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(fields=["created_by", "-id"], name="room_created_by_idx"),
+        ),
+    ]
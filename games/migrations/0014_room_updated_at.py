@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("games", "0013_room_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(fields=["updated_at"], name="room_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="room",
+            index=models.Index(
+                fields=["status", "updated_at"], name="room_status_updated_idx"
+            ),
+        ),
+    ]
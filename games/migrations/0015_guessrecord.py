@@ -0,0 +1,124 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def move_guesses_to_rows(apps, schema_editor):
+    Room = apps.get_model("games", "Room")
+    GuessRecord = apps.get_model("games", "GuessRecord")
+    rooms = Room.objects.filter(game_state__has_key="guesses").only(
+        "id", "game_state", "updated_at"
+    )
+    for room in rooms.iterator(chunk_size=500):
+        guesses = room.game_state.get("guesses") or []
+        records = []
+        for seq, guess in enumerate(guesses):
+            timestamp = guess.get("timestamp")
+            timestamp = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+            records.append(
+                GuessRecord(
+                    room_id=room.id,
+                    game_number=0,
+                    seq=seq,
+                    player=str(guess.get("player") or ""),
+                    guess=str(guess.get("guess") or ""),
+                    bulls=guess.get("bulls") or 0,
+                    cows=guess.get("cows") or 0,
+                    timestamp=timestamp or room.updated_at,
+                )
+            )
+        GuessRecord.objects.bulk_create(records, batch_size=1000)
+        state = {k: v for k, v in room.game_state.items() if k != "guesses"}
+        Room.objects.filter(id=room.id).update(
+            game_state=state, guess_count=len(records)
+        )
+
+
+def move_rows_to_guesses(apps, schema_editor):
+    Room = apps.get_model("games", "Room")
+    GuessRecord = apps.get_model("games", "GuessRecord")
+    rooms = Room.objects.filter(guess_count__gt=0).only(
+        "id", "game_state", "game_number"
+    )
+    for room in rooms.iterator(chunk_size=500):
+        rows = (
+            GuessRecord.objects.filter(room_id=room.id, game_number=room.game_number)
+            .order_by("seq")
+            .values_list("player", "guess", "bulls", "cows", "timestamp")
+        )
+        state = dict(room.game_state or {})
+        state["guesses"] = [
+            {
+                "player": player,
+                "guess": guess,
+                "bulls": bulls,
+                "cows": cows,
+                "timestamp": timestamp.isoformat(),
+            }
+            for player, guess, bulls, cows, timestamp in rows
+        ]
+        Room.objects.filter(id=room.id).update(game_state=state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("games", "0014_room_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="game_number",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="guess_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="GuessRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("game_number", models.IntegerField()),
+                ("seq", models.IntegerField()),
+                ("player", models.CharField(max_length=128)),
+                ("guess", models.CharField(max_length=30)),
+                ("bulls", models.SmallIntegerField(default=0)),
+                ("cows", models.SmallIntegerField(default=0)),
+                (
+                    "timestamp",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="guesses",
+                        to="games.room",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("room", "game_number", "seq"),
+                        name="guessrecord_room_game_seq_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(move_guesses_to_rows, move_rows_to_guesses),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_lifecycle_columns(apps, schema_editor):
+    Room = apps.get_model("games", "Room")
+    rooms = Room.objects.exclude(game_state={}).only("id", "game_state", "status")
+    batch = []
+    for room in rooms.iterator(chunk_size=500):
+        state = room.game_state if isinstance(room.game_state, dict) else {}
+        if room.status == "open" and state.get("game_started"):
+            room.status = "playing"
+        room.player_count = len(state.get("players") or ())
+        batch.append(room)
+        if len(batch) >= 500:
+            Room.objects.bulk_update(batch, ["status", "player_count"])
+            batch = []
+    Room.objects.bulk_update(batch, ["status", "player_count"])
+
+
+def drop_lifecycle_statuses(apps, schema_editor):
+    Room = apps.get_model("games", "Room")
+    Room.objects.filter(status__in=["playing", "archived"]).update(status="open")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("games", "0015_guessrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="player_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="room",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("open", "Open"),
+                    ("playing", "Playing"),
+                    ("finished", "Finished"),
+                    ("archived", "Archived"),
+                ],
+                default="open",
+                max_length=16,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="game",
+            name="room",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="games.room",
+            ),
+        ),
+        migrations.RunPython(fill_lifecycle_columns, drop_lifecycle_statuses),
+    ]
@@ -1,12 +1,16 @@
 from django.db import models
-from django.db.models import JSONField
+from django.db.models import JSONField, Q
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime
 
 User = get_user_model()
 
 
 class Game(models.Model):
-    room = models.ForeignKey("Room", on_delete=models.CASCADE)
+    # archived games outlive their room (games.archive, games.reaper)
+    room = models.ForeignKey("Room", on_delete=models.SET_NULL, null=True)
     participants = models.JSONField(default=list)  # players who submitted a guess
     game_state = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -31,11 +35,75 @@ class Room(models.Model):
     game_state = JSONField(default=dict, blank=True)
     ##################################################################################
 
+    # bumped on every game_state write; saves are compare-and-swap on this column
+    state_version = models.IntegerField(default=0)
+    # guesses live in GuessRecord, not game_state: the rows of the current game
+    # are (room, game_number, 0 .. guess_count - 1)
+    game_number = models.IntegerField(default=0)
+    guess_count = models.IntegerField(default=0)
+
+    OPEN = "open"
+    PLAYING = "playing"
+    FINISHED = "finished"
+    ARCHIVED = "archived"
+    STATUS_CHOICES = [
+        (OPEN, "Open"),
+        (PLAYING, "Playing"),
+        (FINISHED, "Finished"),
+        (ARCHIVED, "Archived"),
+    ]
+    # listed in the lobby; archived rooms only when asked for
+    LIVE_STATUSES = (OPEN, PLAYING, FINISHED)
+    # mirrors game_state so the lobby can filter without reading it; ARCHIVED is
+    # set by games.reaper and left again when the room is joined
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=OPEN)
+    # players in game_state, mirrored the same way so the reaper finds empty rooms
+    player_count = models.IntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, related_name="created_rooms"
     )
-    # updated_at = models.DateTimeField(auto_now=True)
+    # also set by GameService._write_state, whose UPDATE bypasses auto_now
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["updated_at"], name="room_updated_idx"),
+            models.Index(fields=["status", "updated_at"], name="room_status_updated_idx"),
+            models.Index(fields=["status", "-id"], name="room_status_idx"),
+            models.Index(
+                fields=["game_type", "status", "-id"], name="room_type_status_idx"
+            ),
+            models.Index(fields=["created_by", "-id"], name="room_created_by_idx"),
+        ]
+
+    @staticmethod
+    def status_for(game_state: dict) -> str:
+        if game_state.get("game_won") or game_state.get("game_over"):
+            return Room.FINISHED
+        if game_state.get("game_started"):
+            return Room.PLAYING
+        return Room.OPEN
+
+    @staticmethod
+    def player_count_for(game_state: dict) -> int:
+        return len(game_state.get("players") or ())
+
+    @staticmethod
+    def compact_state(state_dict: dict) -> dict:
+        """``state_dict`` as stored in ``game_state``: everything but the guesses."""
+        return {k: v for k, v in state_dict.items() if k != "guesses"}
+
+    @staticmethod
+    def full_state(room_id, game_number: int, game_state: dict) -> dict:
+        """A stored ``game_state`` with its guesses put back from GuessRecord."""
+        if "guesses" in game_state:
+            return game_state
+        return {
+            **game_state,
+            "guesses": GuessRecord.objects.history(room_id, game_number),
+        }
 
     def save(self, *args, **kwargs):
         if not self.name:
@@ -66,10 +134,108 @@ class Room(models.Model):
 
         game_state = GameState(config=config)
 
-        self.game_state = game_state.to_dict()
+        if self.guess_count:
+            # earlier guesses stay filed under the previous game
+            self.game_number += 1
+            self.guess_count = 0
+        self.game_state = Room.compact_state(game_state.to_dict())
+        self.status = Room.status_for(self.game_state)
+        self.player_count = Room.player_count_for(self.game_state)
+        self.state_version += 1
         self.save()
 
 
+class GuessRecordManager(models.Manager):
+    def append(self, room_id, game_number: int, guesses, first_seq: int):
+        """Insert ``guesses`` (dicts as in the game state) as seq ``first_seq``..."""
+        self.bulk_create(
+            [
+                self.model(
+                    room_id=room_id,
+                    game_number=game_number,
+                    seq=first_seq + offset,
+                    player=str(guess.get("player") or ""),
+                    guess=str(guess.get("guess") or ""),
+                    bulls=guess.get("bulls") or 0,
+                    cows=guess.get("cows") or 0,
+                    timestamp=_guess_time(guess.get("timestamp")),
+                )
+                for offset, guess in enumerate(guesses)
+            ]
+        )
+
+    def history(self, room_id, game_number: int) -> list:
+        """The guesses of one game in play order, as the game state lists them."""
+        rows = (
+            self.filter(room_id=room_id, game_number=game_number)
+            .order_by("seq")
+            .values_list(*_HISTORY_FIELDS)
+        )
+        return [history_row(*row) for row in rows]
+
+    def of_games(self, games):
+        """``(room_id, game_number, *history fields)`` rows of several games.
+
+        ``games`` is an iterable of ``(room_id, game_number)``; the rows come in
+        room, game and play order, ready for ``history_row``.
+        """
+        room_ids = {}
+        for room_id, game_number in games:
+            room_ids.setdefault(game_number, []).append(room_id)
+        condition = Q(pk__in=[])
+        for game_number, ids in room_ids.items():
+            condition |= Q(game_number=game_number, room_id__in=ids)
+        return (
+            self.filter(condition)
+            .order_by("room_id", "game_number", "seq")
+            .values_list("room_id", "game_number", *_HISTORY_FIELDS)
+        )
+
+
+_HISTORY_FIELDS = ("player", "guess", "bulls", "cows", "timestamp")
+
+
+def history_row(player, guess, bulls, cows, timestamp) -> dict:
+    return {
+        "player": player,
+        "guess": guess,
+        "bulls": bulls,
+        "cows": cows,
+        "timestamp": timestamp.isoformat(),
+    }
+
+
+def _guess_time(value):
+    if isinstance(value, datetime):
+        return value
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    return parsed or timezone.now()
+
+
+class GuessRecord(models.Model):
+    """One guess, appended when it is played and never updated."""
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="guesses")
+    game_number = models.IntegerField()
+    seq = models.IntegerField()
+    player = models.CharField(max_length=128)
+    guess = models.CharField(max_length=30)
+    bulls = models.SmallIntegerField(default=0)
+    cows = models.SmallIntegerField(default=0)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    objects = GuessRecordManager()
+
+    class Meta:
+        constraints = [
+            # also the index history() reads a game through
+            models.UniqueConstraint(
+                fields=["room", "game_number", "seq"],
+                name="guessrecord_room_game_seq_uniq",
+            )
+        ]
+
+
 class Message(models.Model):
     user = models.ForeignKey(to=User, on_delete=models.CASCADE)
     room = models.ForeignKey(to=Room, on_delete=models.CASCADE)
@@ -0,0 +1,272 @@
+"""Outgoing frames for the game WebSocket.
+
+Every state handed out by the game engine carries ``version``, the room's update
+sequence number. Clients that connect with ``?updates=delta`` get a ``snapshot``
+frame on join and then ``delta`` frames::
+
+    {"type": "snapshot", "seq": 7, "state": {...}}
+    {"type": "delta", "base": 7, "seq": 8, "guesses": [{...}], "changes": {...}}
+
+A delta applies only to the state at ``base``. A client whose own sequence
+number differs has missed an update and sends ``{"type": "resync"}`` to get a
+fresh snapshot.
+
+Room broadcasts are encoded once by the sending connection (``broadcast_event``)
+and travel through the channel layer ready to send, so receivers only write them
+to their socket. Only the variants the room's connections on the sending worker
+use are encoded; a receiver on another worker may build its own.
+
+Clients negotiating the ``bnc.msgpack.v1`` subprotocol exchange the same frames as
+binary MessagePack with short key tags (see ``_TAGS``); guesses travel as digit
+arrays and guess rows as ``[player, digits, bulls, cows, timestamp_ms]``.
+"""
+from datetime import datetime, timezone
+
+import msgpack
+
+from bncapi import codec
+
+UPDATES_FULL = "full"
+UPDATES_DELTA = "delta"
+
+WIRE_JSON = "json"
+WIRE_MSGPACK = "msgpack"
+MSGPACK_SUBPROTOCOL = "bnc.msgpack.v1"
+
+_NOT_DIFFED = ("guesses", "version")
+
+
+def snapshot_frame(state: dict) -> dict:
+    return {"type": "snapshot", "seq": state.get("version"), "state": state}
+
+
+def update_frame(state: dict) -> dict:
+    return {"type": "update", "state": state}
+
+
+def delta_frame(previous: dict, current: dict) -> dict:
+    frame = {
+        "type": "delta",
+        "base": previous.get("version"),
+        "seq": current.get("version"),
+    }
+    frame.update(diff_state(previous, current))
+    return frame
+
+
+def diff_state(previous: dict, current: dict) -> dict:
+    """Guess rows appended since ``previous`` plus top-level fields that changed.
+
+    Guesses are append-only within a game; if the list shrank (a reset) the whole
+    list is sent under ``changes`` instead.
+    """
+    delta = {}
+    changes = {}
+
+    old_guesses = previous.get("guesses") or []
+    new_guesses = current.get("guesses") or []
+    if len(new_guesses) >= len(old_guesses) and (
+        not old_guesses or new_guesses[len(old_guesses) - 1] == old_guesses[-1]
+    ):
+        if len(new_guesses) > len(old_guesses):
+            delta["guesses"] = new_guesses[len(old_guesses) :]
+    else:
+        changes["guesses"] = new_guesses
+
+    for key, value in current.items():
+        if key in _NOT_DIFFED:
+            continue
+        if key not in previous or previous[key] != value:
+            changes[key] = value
+
+    removed = [key for key in previous if key not in current]
+    if removed:
+        delta["removed"] = removed
+    if changes:
+        delta["changes"] = changes
+    return delta
+
+
+VARIANTS = (
+    (WIRE_JSON, UPDATES_FULL),
+    (WIRE_JSON, UPDATES_DELTA),
+    (WIRE_MSGPACK, UPDATES_FULL),
+    (WIRE_MSGPACK, UPDATES_DELTA),
+)
+
+
+def variant_frame(state: dict, previous: dict | None, updates: str) -> dict:
+    if updates == UPDATES_FULL:
+        return update_frame(state)
+    if previous:
+        return delta_frame(previous, state)
+    # no base shared with the receiver, e.g. a join
+    return snapshot_frame(state)
+
+
+def encode_frame(frame: dict, wire: str):
+    return pack(frame) if wire == WIRE_MSGPACK else codec.dumps(frame)
+
+
+def broadcast_event(state: dict, previous: dict | None, variants=VARIANTS) -> dict:
+    """Channel-layer event carrying the update, encoded for the given variants.
+
+    ``variants`` are the ``(wire, updates)`` pairs the room's connections use.
+    The full JSON frame is always included, since every receiver keeps it as
+    the base of its next delta; a receiver whose variant was left out builds
+    it with ``event_frame``.
+    """
+    frames = {WIRE_JSON: {UPDATES_FULL: codec.dumps(update_frame(state))}}
+    built = {}
+    for wire, updates in variants:
+        if (wire, updates) == (WIRE_JSON, UPDATES_FULL):
+            continue
+        if updates not in built:
+            built[updates] = variant_frame(state, previous, updates)
+        frames.setdefault(wire, {})[updates] = encode_frame(built[updates], wire)
+    return {"type": "game_update", "seq": state.get("version"), "frames": frames}
+
+
+def event_frame(event: dict, wire: str, updates: str, previous=None):
+    """The encoded frame of one variant of a ``broadcast_event``.
+
+    ``previous`` is a callable returning the receiver's last-seen state; it is
+    only called when the sender didn't encode this variant.
+    """
+    frame = event["frames"].get(wire, {}).get(updates)
+    if frame is not None:
+        return frame
+    state = state_from_frame(event["frames"][WIRE_JSON][UPDATES_FULL])
+    base = previous() if previous is not None else None
+    return encode_frame(variant_frame(state, base, updates), wire)
+
+
+def state_from_frame(text: str) -> dict:
+    """Recover the state from an encoded full JSON update frame."""
+    return codec.loads(text)["state"]
+
+
+_TAGS = {
+    "type": "t",
+    "state": "s",
+    "seq": "q",
+    "base": "b",
+    "changes": "c",
+    "removed": "r",
+    "message": "m",
+    "payload": "p",
+    "action": "a",
+    "guess": "x",
+    "guesses": "g",
+    "players": "pl",
+    "remaining_guesses": "rg",
+    "game_won": "gw",
+    "game_over": "go",
+    "game_started": "gs",
+    "winner": "w",
+    "version": "v",
+}
+_UNTAGS = {tag: key for key, tag in _TAGS.items()}
+_ROW_FIELDS = ("player", "guess", "bulls", "cows", "timestamp")
+
+
+class FrameError(ValueError):
+    pass
+
+
+def pack(frame: dict) -> bytes:
+    return msgpack.packb(_tag(frame))
+
+
+def unpack(data: bytes) -> dict:
+    try:
+        frame = msgpack.unpackb(data)
+    except Exception as e:
+        raise FrameError(f"Invalid MessagePack frame: {e}") from e
+    if not isinstance(frame, dict):
+        raise FrameError("Frame must be a map")
+    return _untag(frame)
+
+
+def _tag(obj: dict) -> dict:
+    tagged = {}
+    for key, value in obj.items():
+        if key == "guesses" and isinstance(value, list):
+            value = [_pack_row(row) for row in value]
+        elif key == "guess" and isinstance(value, str) and value.isdigit():
+            value = [int(digit) for digit in value]
+        elif isinstance(value, dict):
+            value = _tag(value)
+        if key == "removed" and isinstance(value, list):
+            value = [_TAGS.get(name, name) for name in value]
+        tagged[_TAGS.get(key, key)] = value
+    return tagged
+
+
+def _untag(obj: dict) -> dict:
+    untagged = {}
+    for tag, value in obj.items():
+        key = _UNTAGS.get(tag, tag)
+        if key == "guesses" and isinstance(value, list):
+            value = [_unpack_row(row) for row in value]
+        elif key == "guess" and isinstance(value, list):
+            value = "".join(str(digit) for digit in value)
+        elif isinstance(value, dict):
+            value = _untag(value)
+        if key == "removed" and isinstance(value, list):
+            value = [_UNTAGS.get(name, name) for name in value]
+        untagged[key] = value
+    return untagged
+
+
+def _pack_row(row):
+    if not isinstance(row, dict):
+        return row
+
+    guess = row.get("guess")
+    if isinstance(guess, str) and guess.isdigit():
+        guess = [int(digit) for digit in guess]
+
+    timestamp = row.get("timestamp")
+    if isinstance(timestamp, str):
+        try:
+            timestamp = int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+        except ValueError:
+            pass
+
+    packed = [row.get("player"), guess, row.get("bulls"), row.get("cows"), timestamp]
+    extra = {key: value for key, value in row.items() if key not in _ROW_FIELDS}
+    if extra:
+        packed.append(extra)
+    return packed
+
+
+def _unpack_row(packed):
+    if not isinstance(packed, list):
+        return packed
+
+    if len(packed) not in (len(_ROW_FIELDS), len(_ROW_FIELDS) + 1):
+        raise FrameError(f"Guess row must have {len(_ROW_FIELDS)} fields")
+    row = dict(zip(_ROW_FIELDS, packed[: len(_ROW_FIELDS)], strict=True))
+    if isinstance(row.get("guess"), list):
+        row["guess"] = "".join(str(digit) for digit in row["guess"])
+    if isinstance(row.get("timestamp"), int):
+        row["timestamp"] = datetime.fromtimestamp(
+            row["timestamp"] / 1000, tz=timezone.utc
+        ).isoformat()
+    if len(packed) > len(_ROW_FIELDS) and isinstance(packed[-1], dict):
+        row.update(packed[-1])
+    return row
+
+
+def apply_delta(state: dict, frame: dict) -> dict:
+    """Reference client-side application of a delta frame."""
+    if state.get("version") != frame["base"]:
+        raise ValueError(f"delta base {frame['base']} != {state.get('version')}")
+
+    new_state = {k: v for k, v in state.items() if k not in frame.get("removed", ())}
+    new_state.update(frame.get("changes", {}))
+    if frame.get("guesses"):
+        new_state["guesses"] = list(new_state.get("guesses") or []) + frame["guesses"]
+    new_state["version"] = frame["seq"]
+    return new_state
@@ -0,0 +1,168 @@
+"""Room lifecycle: idle rooms are archived, long-archived ones deleted.
+
+A room goes open -> playing -> finished with its game (``Room.status_for``).
+Once it has had no players (``Room.player_count``, mirrored from the game state
+by every save) for ``ROOM_IDLE_AFTER`` seconds it is archived: it leaves the
+lobby, its game_state and secret are cleared, and its last game is filed under
+an earlier game_number for ``games.archive`` to move out. Joining an archived
+room starts a fresh game and makes it live again.
+
+Archived rooms are deleted ``ROOM_EXPIRE_AFTER`` seconds later, once
+``archive_games`` has moved every guess out; their Game rows stay. A room whose
+guesses can't be archived (the archiver logs why) is kept: it is counted as
+stuck and logged by every sweep instead.
+
+``sweep`` does all three, archiving games in between, in batched UPDATEs and
+DELETEs of ``ROOM_REAPER_BATCH_SIZE`` rooms. ``RoomReaper`` runs it every
+``ROOM_REAPER_INTERVAL`` seconds on the event loop of each worker that has had
+a player join; ``manage.py compact_rooms`` runs it once. With
+``ROOM_REAPER_ARCHIVE_GAMES`` off (e.g. workers on several hosts, each with its
+own ``GAME_ARCHIVE_DIR``) the sweeper leaves games to ``manage.py
+archive_games``, which must then be scheduled for rooms to expire.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from bncapi import metrics, response_cache
+from . import archive, snapshots
+from .models import GuessRecord, Room
+from .state_cache import state_cache
+
+logger = logging.getLogger(__name__)
+
+IDLE_AFTER = getattr(settings, "ROOM_IDLE_AFTER", 60 * 60)
+EXPIRE_AFTER = getattr(settings, "ROOM_EXPIRE_AFTER", 7 * 24 * 60 * 60)
+BATCH_SIZE = getattr(settings, "ROOM_REAPER_BATCH_SIZE", 500)
+INTERVAL = getattr(settings, "ROOM_REAPER_INTERVAL", 300)
+ARCHIVE_GAMES = getattr(settings, "ROOM_REAPER_ARCHIVE_GAMES", True)
+
+
+def _batches(rooms, batch_size):
+    """Ids of ``rooms`` a batch at a time, re-reading after each batch is handled."""
+    while True:
+        room_ids = list(rooms.order_by("id").values_list("id", flat=True)[:batch_size])
+        if room_ids:
+            yield room_ids
+        if len(room_ids) < batch_size:
+            return
+
+
+def archive_idle_rooms(idle_after=IDLE_AFTER, batch_size=BATCH_SIZE) -> int:
+    now = timezone.now()
+    idle = Room.objects.filter(
+        status__in=Room.LIVE_STATUSES,
+        player_count=0,
+        updated_at__lt=now - timedelta(seconds=idle_after),
+    )
+    archived = 0
+    for room_ids in _batches(idle, batch_size):
+        # filtered again: a room joined since the read stays live
+        archived += idle.filter(id__in=room_ids).update(
+            status=Room.ARCHIVED,
+            game_state={},
+            secret_code="",
+            game_number=F("game_number") + 1,
+            guess_count=0,
+            state_version=F("state_version") + 1,
+            updated_at=now,
+        )
+        for room_id in room_ids:
+            snapshots.forget(room_id)
+            state_cache.forget(room_id)
+    return archived
+
+
+def _past_expiry(expire_after):
+    return Room.objects.filter(
+        status=Room.ARCHIVED,
+        updated_at__lt=timezone.now() - timedelta(seconds=expire_after),
+    )
+
+
+def expire_archived_rooms(expire_after=EXPIRE_AFTER, batch_size=BATCH_SIZE) -> int:
+    expired_rooms = _past_expiry(expire_after).exclude(
+        Exists(GuessRecord.objects.filter(room=OuterRef("pk")))
+    )
+    expired = 0
+    for room_ids in _batches(expired_rooms, batch_size):
+        _total, by_model = expired_rooms.filter(id__in=room_ids).delete()
+        expired += by_model.get(Room._meta.label, 0)
+    return expired
+
+
+def stuck_rooms(expire_after=EXPIRE_AFTER) -> int:
+    """Archived rooms past their expiry that still hold guesses."""
+    return (
+        _past_expiry(expire_after)
+        .filter(Exists(GuessRecord.objects.filter(room=OuterRef("pk"))))
+        .count()
+    )
+
+
+def sweep(
+    idle_after=IDLE_AFTER,
+    expire_after=EXPIRE_AFTER,
+    batch_size=BATCH_SIZE,
+    archive_games=ARCHIVE_GAMES,
+) -> dict:
+    """Archive idle rooms and their games, delete expired rooms; how many of each.
+
+    ``stuck`` counts the rooms that would have expired but for their guesses.
+    """
+    archived = archive_idle_rooms(idle_after, batch_size)
+    # the archived rooms' guesses leave GuessRecord, so they can expire
+    games = archive.archive_games(batch_size=batch_size) if archive_games else 0
+    expired = expire_archived_rooms(expire_after, batch_size)
+    stuck = stuck_rooms(expire_after)
+    if archived or expired:
+        response_cache.invalidate(response_cache.ROOMS)
+    if stuck:
+        why = "see the archiver's warnings" if archive_games else "not archiving games"
+        logger.warning(f"{stuck} rooms past expiry still hold guesses ({why})")
+    metrics.incr("room_reaper.sweeps")
+    metrics.incr("room_reaper.archived", archived)
+    metrics.incr("room_reaper.games", games)
+    metrics.incr("room_reaper.expired", expired)
+    return {"archived": archived, "games": games, "expired": expired, "stuck": stuck}
+
+
+class RoomReaper:
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.last_sweep = {"archived": 0, "games": 0, "expired": 0, "stuck": 0}
+        self._task = None
+
+    def ensure_started(self):
+        """Start sweeping on the running event loop, unless already (or disabled)."""
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.last_sweep = await database_sync_to_async(sweep)()
+            except Exception as e:
+                logger.error(
+                    f"Room sweep failed: {type(e).__name__}: {e}", exc_info=True
+                )
+                continue
+            if any(self.last_sweep[key] for key in ("archived", "games", "expired")):
+                logger.info(
+                    f"Room sweep archived {self.last_sweep['archived']} rooms and "
+                    f"{self.last_sweep['games']} games, deleted "
+                    f"{self.last_sweep['expired']} rooms"
+                )
+
+
+reaper = RoomReaper()
+metrics.gauge("room_reaper.last_archived", lambda: reaper.last_sweep["archived"])
+metrics.gauge("room_reaper.last_expired", lambda: reaper.last_sweep["expired"])
+metrics.gauge("room_reaper.stuck", lambda: reaper.last_sweep["stuck"])
@@ -1,4 +1,6 @@
-from ninja import ModelSchema
+from typing import Literal
+
+from ninja import Field, FilterSchema, ModelSchema, Schema
 from .models import Room
 
 
@@ -16,6 +18,25 @@ class RoomSchema(ModelSchema):
         ]
 
 
+class RoomFilterSchema(FilterSchema):
+    game_type: int | None = None
+    code_length: int | None = None
+    num_of_colors: int | None = None
+    status: Literal["open", "playing", "finished", "archived"] | None = None
+    created_by: int | None = Field(None, q="created_by_id")
+
+
+class RoomPageSchema(Schema):
+    items: list[RoomSchema]
+    next_cursor: str | None
+
+
+class RoomStateSchema(Schema):
+    room_id: int
+    version: int
+    state: dict
+
+
 class CreateRoomSchema(ModelSchema):
     class Meta:
         model = Room
@@ -1,43 +1,136 @@
+import copy
+
 from channels.db import database_sync_to_async
-from .models import Room
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from bncapi import response_cache
+from . import snapshots
+from .models import GuessRecord, Room
+from .state_cache import state_cache
 from bncpy.bnc import GameState, GameConfig
+from bncpy.bnc.utils import get_random_number
 import logging
 
 logger = logging.getLogger(__name__)
 
+SAVE_ATTEMPTS = getattr(settings, "GAME_STATE_SAVE_ATTEMPTS", 5)
+
 
 class GameService:
     @staticmethod
     @database_sync_to_async
     def handle_move(room_id, payload, player_info):
+        """``(previous, state)``: the room's state before and after the move.
+
+        Both carry their ``version``; ``previous`` is the base of the delta the
+        move is broadcast as. On failure ``(None, error)``.
+        """
         try:
-            room = Room.objects.get(id=room_id)
-            action = payload.get("action")
-            state = GameService._load_state(room)
+            # optimistic concurrency: if another worker saved the room since we
+            # loaded it, reload and apply the move again on top of its state
+            for _attempt in range(SAVE_ATTEMPTS):
+                # game_state is only read if state_cache misses
+                room = Room.objects.defer("game_state").get(id=room_id)
+                state = GameService._load_state(room)
+                previous = GameService.detached_state(state)
+                previous["version"] = room.state_version
 
-            if action == "submit_guess":
-                result = GameService._handle_guess(
-                    state, room, payload.get("guess"), player_info
-                )
-            elif action == "reset_game":
-                result = GameService._reset_game(state, room)
-            elif action == "join_room":
-                result = GameService._join_room(state, room, player_info)
-            elif action == "leave_room":
-                result = GameService._leave_room(state, room, player_info)
-            elif action == "start_game":
-                result = GameService._start_game(state, room)
-            else:
-                return {"error": "Unknown action"}
-            return result
+                error = GameService.apply_move(state, payload, player_info)
+                if error:
+                    # a rejected move leaves the state as it was
+                    GameService._keep_state(room, state)
+                    return None, error
+
+                state_dict = GameService._save_state(state, room)
+                if state_dict is not None:
+                    return previous, {**state_dict, "version": room.state_version}
+                logger.info(f"Version conflict saving room {room_id}, retrying")
+
+            logger.warning(
+                f"Gave up saving room {room_id} after {SAVE_ATTEMPTS} conflicts"
+            )
+            return None, {"error": "Room is busy, please try again"}
 
         except Room.DoesNotExist:
-            return {"error": "Room not found"}
+            return None, {"error": "Room not found"}
         except Exception as e:
-            return {"error": str(e)}
+            return None, {"error": str(e)}
+
+    @staticmethod
+    @database_sync_to_async
+    def join_room(room_id, player_info):
+        """Connect a player: ``(room, state)``, or ``(None, error)`` if it doesn't exist.
+
+        One read and one compare-and-swap write: a room nobody has joined yet is
+        initialized in memory and saved together with the join.
+        """
+        payload = {"action": "join_room", "token": player_info.get("token")}
+        try:
+            for _attempt in range(SAVE_ATTEMPTS):
+                # not deferred: a joining connection rarely finds its state cached
+                room = Room.objects.get(id=room_id)
+                state = GameService._load_state(room)
+
+                error = GameService.apply_move(state, payload, player_info)
+                if error:
+                    GameService._keep_state(room, state)
+                    return room, error
+
+                state_dict = GameService._save_state(state, room)
+                if state_dict is not None:
+                    return room, {**state_dict, "version": room.state_version}
+                logger.info(f"Version conflict joining room {room_id}, retrying")
+
+            logger.warning(
+                f"Gave up joining room {room_id} after {SAVE_ATTEMPTS} conflicts"
+            )
+            return room, {"error": "Room is busy, please try again"}
+
+        except Room.DoesNotExist:
+            return None, {"error": "Room not found"}
+
+    @staticmethod
+    def apply_move(state: GameState, payload, player_info) -> dict | None:
+        """Apply one action to ``state`` in memory; returns an error dict or None."""
+        action = payload.get("action")
+
+        if action == "submit_guess":
+            return GameService._handle_guess(state, payload.get("guess"), player_info)
+        elif action == "reset_game":
+            return GameService._reset_game(state)
+        elif action == "join_room":
+            return GameService._join_room(state, player_info)
+        elif action == "leave_room":
+            return GameService._leave_room(state, player_info)
+        elif action == "start_game":
+            return GameService._start_game(state)
+        return {"error": "Unknown action"}
+
+    @staticmethod
+    def detached_state(state: GameState) -> dict:
+        """``state.to_dict()`` left as it is by later moves on ``state``."""
+        # to_dict() may hand out the state's own lists, which moves mutate
+        return {key: copy.copy(value) for key, value in state.to_dict().items()}
+
+    @staticmethod
+    def is_game_over(state_dict: dict) -> bool:
+        return bool(state_dict.get("game_won") or state_dict.get("game_over"))
 
     @staticmethod
     def _load_state(room) -> GameState:
+        state = state_cache.checkout(room.id, room.state_version)
+        if state is not None:
+            return state
+
+        if not room.game_state and not room.secret_code:
+            # never played: the secret is drawn here and saved with the first
+            # write, instead of by a separate Room.initialize_game()
+            room.secret_code = get_random_number(
+                length=room.code_length, max_value=room.num_of_colors
+            )
+
         config = GameConfig(
             code_length=room.code_length,
             num_of_colors=room.num_of_colors,
@@ -48,7 +141,8 @@ class GameService:
 
         if room.game_state and isinstance(room.game_state, dict):
             try:
-                return GameState.from_dict(room.game_state, config)
+                state_dict = Room.full_state(room.id, room.game_number, room.game_state)
+                return GameState.from_dict(state_dict, config)
             except Exception as e:
                 logger.error(f"Error loading game state: {e}, creating new state")
                 return GameState(config=config)
@@ -56,48 +150,122 @@ class GameService:
             return GameState(config=config)
 
     @staticmethod
-    def _save_state(state: GameState, room) -> dict:
-        room.secret_code = state.config.secret_code
+    def _keep_state(room, state: GameState) -> None:
+        """Check an unchanged state back in, so the next move doesn't reload it."""
+        state_cache.checkin(room.id, room.state_version, state, state.to_dict())
 
+    @staticmethod
+    def _save_state(state: GameState, room) -> dict | None:
+        """Compare-and-swap the state onto ``room``; None on a version conflict."""
         state_dict = state.to_dict()
+        secret_code = state.config.secret_code
+
+        written = GameService._write_state(
+            room.id,
+            state_dict,
+            secret_code,
+            room.state_version,
+            game_number=room.game_number,
+            saved_guesses=room.guess_count,
+            previous=(room.status, room.player_count),
+        )
+        if written is None:
+            return None
+
+        room.game_number, room.guess_count = written
+        room.secret_code = secret_code
         room.game_state = state_dict
-        room.save()
+        room.status = Room.status_for(state_dict)
+        room.player_count = Room.player_count_for(state_dict)
+        room.state_version += 1
+        # the state just written is the one the room's next move starts from
+        state_cache.checkin(room.id, room.state_version, state, state_dict)
 
         return state_dict
 
     @staticmethod
-    def _handle_guess(state: GameState, room, guess: str, player_info=None) -> dict:
+    def _write_state(
+        room_id,
+        state_dict: dict,
+        secret_code,
+        version: int,
+        moves: int = 1,
+        *,
+        game_number: int,
+        saved_guesses: int,
+        previous: tuple[str, int] | None = None,
+    ) -> tuple[int, int] | None:
+        """``UPDATE ... WHERE state_version = version`` touching only the state columns.
+
+        The version advances by the number of moves folded into ``state_dict`` so
+        it doubles as the room's update sequence number. ``game_state`` is stored
+        without its guesses; the ones past the ``saved_guesses`` rows already in
+        GuessRecord are inserted in the same transaction. ``previous`` is the
+        ``(status, player_count)`` the row had at ``version``; the room list is
+        invalidated when they change (or aren't known). Returns the room's
+        ``(game_number, guess_count)`` afterwards, or None on a version conflict.
+        """
+        status = Room.status_for(state_dict)
+        guesses = state_dict.get("guesses") or []
+        if len(guesses) < saved_guesses:
+            # the game was reset: its guesses are numbered from 0 again
+            game_number, saved_guesses = game_number + 1, 0
+
+        player_count = Room.player_count_for(state_dict)
+        with transaction.atomic():
+            updated = Room.objects.filter(id=room_id, state_version=version).update(
+                game_state=Room.compact_state(state_dict),
+                secret_code=secret_code,
+                status=status,
+                player_count=player_count,
+                game_number=game_number,
+                guess_count=len(guesses),
+                state_version=F("state_version") + moves,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                return None
+            # the UPDATE holds the room's row lock: no other writer can append
+            # to this game until the transaction commits
+            if len(guesses) > saved_guesses:
+                GuessRecord.objects.append(
+                    room_id, game_number, guesses[saved_guesses:], saved_guesses
+                )
+
+        snapshots.store(room_id, version + moves, state_dict)
+        if previous != (status, player_count):
+            # cached lobby pages list the room under its old status or players
+            response_cache.invalidate(response_cache.ROOMS)
+        return game_number, len(guesses)
+
+    @staticmethod
+    def _handle_guess(state: GameState, guess: str, player_info=None) -> dict | None:
         player_token = player_info.get("token") if player_info else "Anonymous"
         result = state.submit_guess(player_token, guess)
 
         if "error" in result:
             return result
-
-        return GameService._save_state(state, room)
+        return None
 
     @staticmethod
-    def _reset_game(state: GameState, room) -> dict:
+    def _reset_game(state: GameState) -> None:
         state.reset()
-        return GameService._save_state(state, room)
 
     @staticmethod
-    def _start_game(state: GameState, room) -> dict:
+    def _start_game(state: GameState) -> None:
         if not state.config.secret_code:
             state.config.secret_code = state.config.generate_secret_code()
 
         state.game_started = True
-        return GameService._save_state(state, room)
 
     @staticmethod
-    def _join_room(state: GameState, room, player_info) -> dict:
+    def _join_room(state: GameState, player_info) -> None:
         if player_info and player_info.get("token"):
             player_token = player_info["token"]
             state.add_player(player_token)
-        return GameService._save_state(state, room)
 
     @staticmethod
-    def _leave_room(state: GameState, room, player_info) -> dict:
+    def _leave_room(state: GameState, player_info) -> None:
         if player_info and player_info.get("token"):
             player_token = player_info["token"]
             state.remove_player(player_token)
-        return GameService._save_state(state, room)
@@ -0,0 +1,41 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bncapi import response_cache
+from knoxtokens.models import KnoxToken
+from . import snapshots
+from .models import Room
+from .state_cache import state_cache
+from .utils import token_group_name
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_delete, sender=KnoxToken)
+def notify_token_revoked(sender, instance, **kwargs):
+    # open game sockets drop the identity they cached at connect time
+    group = token_group_name(instance.token_key)
+    if not group:
+        return
+    try:
+        async_to_sync(get_channel_layer().group_send)(group, {"type": "token_revoked"})
+    except Exception as e:
+        logger.error(f"Error notifying token revocation: {type(e).__name__}: {e}")
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_cached_rooms(sender, instance, **kwargs):
+    response_cache.invalidate(response_cache.ROOMS)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def forget_room_state(sender, instance, **kwargs):
+    # whole-row saves (e.g. initialize_game) bypass GameService._write_state
+    snapshots.forget(instance.pk)
+    state_cache.forget(instance.pk)
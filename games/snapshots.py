@@ -0,0 +1,86 @@
+"""Read-only room state for REST clients.
+
+Every successful state write stores the room's public state (secret removed)
+and version in the Django cache named by ``ROOM_STATE_CACHE_ALIAS``, so
+``GET /games/rooms/{id}/state`` is normally one cache read. On a miss the state
+is rebuilt from ``Room.game_state`` and the game's GuessRecord rows, and cached.
+Nothing here touches the players or writes the room.
+
+A worker only refreshes the snapshots in its own cache, so unless the alias is
+shared by every worker (``response_cache.is_shared``) they are kept for
+``ROOM_STATE_CACHE_LOCAL_TTL`` seconds at most before being rebuilt from the
+database.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from bncapi import response_cache
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = getattr(settings, "ROOM_STATE_CACHE_ALIAS", "default")
+CACHE_TTL = getattr(settings, "ROOM_STATE_CACHE_TTL", 300)
+LOCAL_TTL = getattr(settings, "ROOM_STATE_CACHE_LOCAL_TTL", 2)
+
+_SECRET_KEYS = ("secret_code",)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _ttl() -> int:
+    if response_cache.is_shared(CACHE_ALIAS):
+        return CACHE_TTL
+    return min(CACHE_TTL, LOCAL_TTL)
+
+
+def _key(room_id) -> str:
+    return f"room-state:{room_id}"
+
+
+def public_state(state_dict: dict) -> dict:
+    state = {k: v for k, v in state_dict.items() if k not in _SECRET_KEYS}
+    if isinstance(state.get("config"), dict):
+        state["config"] = {
+            k: v for k, v in state["config"].items() if k not in _SECRET_KEYS
+        }
+    return state
+
+
+def store(room_id, version: int, state_dict: dict, replace=True):
+    snapshot = {"version": version, "state": public_state(state_dict)}
+    try:
+        if replace:
+            _cache().set(_key(room_id), snapshot, _ttl())
+        else:
+            _cache().add(_key(room_id), snapshot, _ttl())
+    except Exception as e:
+        logger.error(f"Error caching state of room {room_id}: {type(e).__name__}: {e}")
+
+
+def forget(room_id):
+    _cache().delete(_key(room_id))
+
+
+def load(room_id) -> dict | None:
+    """``{"version": ..., "state": ...}`` for the room, or None if it doesn't exist."""
+    snapshot = _cache().get(_key(room_id))
+    if snapshot is not None:
+        return snapshot
+
+    row = (
+        Room.objects.filter(id=room_id)
+        .values("game_state", "state_version", "game_number")
+        .first()
+    )
+    if row is None:
+        return None
+    state_dict = row["game_state"] if isinstance(row["game_state"], dict) else {}
+    state_dict = Room.full_state(room_id, row["game_number"], state_dict)
+    # add, not set: a write that landed since the read must not be overwritten
+    store(room_id, row["state_version"], state_dict, replace=False)
+    return {"version": row["state_version"], "state": public_state(state_dict)}
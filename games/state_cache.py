@@ -0,0 +1,125 @@
+"""Deserialized GameState objects, kept between moves.
+
+``GameService`` rebuilt a ``GameState`` from ``Room.game_state`` on every move,
+re-parsing the whole guess history. After a successful save the state it just
+wrote is checked in here under the room and its new ``state_version``; the next
+move reads only the room's columns (``defer("game_state")``) and checks the
+state out if the version still matches. A write by another worker bumps the
+version, so a stale entry is never returned, only dropped.
+
+Checkout removes the entry: moves mutate the state in place, and a move whose
+save loses the compare-and-swap must not leave its half-applied state behind. A
+rejected move changes nothing, so its state is checked back in as it was.
+
+Entries are evicted least recently used first: past ``GAME_STATE_CACHE_SIZE``
+rooms, past ``GAME_STATE_CACHE_MAX_BYTES`` of estimated state size, and when
+unused for ``GAME_STATE_CACHE_IDLE`` seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from bncapi import metrics
+
+CACHE_SIZE = getattr(settings, "GAME_STATE_CACHE_SIZE", 1000)
+CACHE_MAX_BYTES = getattr(settings, "GAME_STATE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+CACHE_IDLE = getattr(settings, "GAME_STATE_CACHE_IDLE", 300)
+
+# rough in-memory cost of a state: a fixed part plus one per guess and player
+_BASE_BYTES = 2048
+_ENTRY_BYTES = 512
+
+
+def estimate_size(state_dict: dict) -> int:
+    entries = len(state_dict.get("guesses") or ()) + len(state_dict.get("players") or ())
+    return _BASE_BYTES + _ENTRY_BYTES * entries
+
+
+class GameStateCache:
+    def __init__(self, max_size=CACHE_SIZE, max_bytes=CACHE_MAX_BYTES, idle=CACHE_IDLE):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.idle = idle
+        self.bytes = 0
+        # room_id -> (state_version, state, size, last_used)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def checkout(self, room_id, version: int):
+        """The cached state of ``room_id`` at ``version``, handed over; else None."""
+        if self.max_size <= 0:
+            return None
+
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            entry = self._entries.pop(room_id, None)
+            if entry is not None:
+                self.bytes -= entry[2]
+
+        if entry is not None and entry[0] == version:
+            metrics.incr("state_cache.hit")
+            return entry[1]
+        if entry is not None:
+            # written by another worker since
+            metrics.incr("state_cache.stale")
+        metrics.incr("state_cache.miss")
+        return None
+
+    def checkin(self, room_id, version: int, state, state_dict: dict):
+        if self.max_size <= 0:
+            return
+
+        size = estimate_size(state_dict)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(room_id, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[room_id] = (version, state, size, time.monotonic())
+            self.bytes += size
+            while len(self._entries) > self.max_size or self.bytes > self.max_bytes:
+                self._evict_oldest()
+
+    def forget(self, room_id):
+        with self._lock:
+            entry = self._entries.pop(room_id, None)
+            if entry is not None:
+                self.bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict_idle(self, now):
+        # least recently used first, so stop at the first fresh entry
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry[3] < self.idle:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        _room_id, entry = self._entries.popitem(last=False)
+        self.bytes -= entry[2]
+        metrics.incr("state_cache.evicted")
+
+
+def hit_ratio() -> float:
+    values = metrics.counters()
+    hits = values.get("state_cache.hit", 0)
+    total = hits + values.get("state_cache.miss", 0)
+    return round(hits / total, 4) if total else 0.0
+
+
+state_cache = GameStateCache()
+metrics.gauge("state_cache.size", state_cache.__len__)
+metrics.gauge("state_cache.bytes", lambda: state_cache.bytes)
+metrics.gauge("state_cache.hit_ratio", hit_ratio)
@@ -1,3 +1,300 @@
-from django.test import TestCase
+from datetime import UTC, date, datetime
+from itertools import pairwise
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase
+
+from bncapi import codec
+from . import engine, protocol
+from .models import GuessRecord, Room
+from .services import SAVE_ATTEMPTS, GameService
+from .state_cache import state_cache
+
+PLAYER = {"token": "player-1"}
+
+
+class GameServiceSaveTests(TestCase):
+    def setUp(self):
+        state_cache.clear()
+        self.room = Room.objects.create(name="cas", code_length=4, num_of_colors=6)
+
+    def move(self, action, **payload):
+        _previous, state = async_to_sync(GameService.handle_move)(
+            self.room.id, {"action": action, **payload}, PLAYER
+        )
+        return state
+
+    def test_gives_up_after_save_attempts_conflicts(self):
+        with mock.patch.object(
+            GameService, "_write_state", return_value=None
+        ) as write_state:
+            result = self.move("join_room", token=PLAYER["token"])
+
+        self.assertEqual(result, {"error": "Room is busy, please try again"})
+        self.assertEqual(write_state.call_count, SAVE_ATTEMPTS)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.state_version, 0)
+
+    def test_rejected_move_keeps_the_cached_state(self):
+        self.move("join_room", token=PLAYER["token"])
+        self.room.refresh_from_db()
+
+        self.assertEqual(self.move("fly"), {"error": "Unknown action"})
+        self.assertIsNotNone(
+            state_cache.checkout(self.room.id, self.room.state_version)
+        )
+
+    def test_retries_on_the_state_another_writer_saved(self):
+        write_state = GameService._write_state
+        calls = []
+
+        def conflict_once(room_id, *args, **kwargs):
+            calls.append(args[2])
+            if len(calls) == 1:
+                # another worker saves the room between our read and write
+                Room.objects.filter(id=room_id).update(
+                    state_version=F("state_version") + 1
+                )
+                return None
+            return write_state(room_id, *args, **kwargs)
+
+        with mock.patch.object(GameService, "_write_state", side_effect=conflict_once):
+            result = self.move("join_room", token=PLAYER["token"])
+
+        self.assertNotIn("error", result)
+        self.assertEqual(calls, [0, 1])
+        self.assertEqual(result["version"], 2)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.state_version, 2)
+
+    def test_reset_starts_a_new_game_number(self):
+        self.move("join_room", token=PLAYER["token"])
+        self.move("start_game")
+        self.assertNotIn("error", self.move("submit_guess", guess="1234"))
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.game_number, self.room.guess_count), (0, 1))
+
+        self.move("reset_game")
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.game_number, self.room.guess_count), (1, 0))
+
+        self.move("start_game")
+        self.assertNotIn("error", self.move("submit_guess", guess="5612"))
+        self.assertEqual(
+            list(
+                GuessRecord.objects.filter(room=self.room)
+                .order_by("game_number", "seq")
+                .values_list("game_number", "seq", "guess")
+            ),
+            [(0, 0, "1234"), (1, 0, "5612")],
+        )
+
+
+class RoomActorFlushTests(TestCase):
+    def setUp(self):
+        state_cache.clear()
+        self.room = Room.objects.create(name="actor", code_length=4, num_of_colors=6)
+
+    def test_final_flush_replays_the_moves_after_a_conflict(self):
+        write_state = GameService._write_state
+        versions = []
+
+        def conflict_once(room_id, *args, **kwargs):
+            versions.append(args[2])
+            if len(versions) == 1:
+                Room.objects.filter(id=room_id).update(
+                    state_version=F("state_version") + 1
+                )
+                return None
+            return write_state(room_id, *args, **kwargs)
+
+        async def join_and_shut_down():
+            registry = engine.RoomActorRegistry()
+            actor = registry.actor(self.room.id)
+            await actor.submit({"action": "join_room", **PLAYER}, PLAYER)
+            with mock.patch.object(
+                GameService, "_write_state", side_effect=conflict_once
+            ):
+                await registry.flush_all()
+            actor.task.cancel()
+            return actor
+
+        actor = async_to_sync(join_and_shut_down)()
+
+        self.assertFalse(actor.dirty)
+        self.assertEqual(versions, [0, 1])
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.state_version, self.room.player_count), (2, 1))
+
+
+def guess(n, code, bulls=0, cows=0):
+    return {
+        "player": PLAYER["token"],
+        "guess": code,
+        "bulls": bulls,
+        "cows": cows,
+        "timestamp": f"2026-10-18T12:00:0{n}+00:00",
+    }
+
+
+class GuessRecordTests(TestCase):
+    def setUp(self):
+        state_cache.clear()
+        self.room = Room.objects.create(name="history", code_length=4, num_of_colors=6)
+
+    def write(self, guesses):
+        self.room.refresh_from_db()
+        state = {"players": [PLAYER["token"]], "guesses": guesses}
+        written = GameService._write_state(
+            self.room.id,
+            state,
+            "1234",
+            self.room.state_version,
+            game_number=self.room.game_number,
+            saved_guesses=self.room.guess_count,
+        )
+        self.assertIsNotNone(written)
+        self.room.refresh_from_db()
+
+    def full_state(self):
+        return Room.full_state(
+            self.room.id, self.room.game_number, self.room.game_state
+        )
+
+    def test_append_numbers_guesses_from_first_seq(self):
+        GuessRecord.objects.append(self.room.id, 0, [guess(0, "1111")], 0)
+        GuessRecord.objects.append(self.room.id, 0, [guess(1, "2222")], 1)
+
+        self.assertEqual(
+            GuessRecord.objects.history(self.room.id, 0),
+            [guess(0, "1111"), guess(1, "2222")],
+        )
+
+    def test_full_state_puts_the_guesses_back(self):
+        first, second = guess(0, "1111"), guess(1, "2222", bulls=1)
+        self.write([first])
+        self.write([first, second])
+
+        self.assertNotIn("guesses", self.room.game_state)
+        self.assertEqual(GuessRecord.objects.filter(room=self.room).count(), 2)
+        self.assertEqual(self.full_state()["guesses"], [first, second])
+        self.assertEqual(self.full_state()["players"], [PLAYER["token"]])
+
+    def test_reset_mid_game_keeps_the_earlier_game(self):
+        first, second = guess(0, "1111"), guess(1, "2222")
+        self.write([first, second])
+        # a reset and a guess saved together: fewer guesses than were saved
+        third = guess(2, "3333", cows=2)
+        self.write([third])
+
+        self.assertEqual((self.room.game_number, self.room.guess_count), (1, 1))
+        self.assertEqual(self.full_state()["guesses"], [third])
+        self.assertEqual(GuessRecord.objects.history(self.room.id, 0), [first, second])
+
+        self.write([third, guess(3, "4444")])
+        self.assertEqual(
+            [row["guess"] for row in self.full_state()["guesses"]], ["3333", "4444"]
+        )
+
+
+class CodecTests(SimpleTestCase):
+    def test_dates_are_written_as_djangojsonencoder_writes_them(self):
+        value = {
+            "timestamp": datetime(2026, 10, 18, 12, 0, 0, 123456, tzinfo=UTC),
+            "day": date(2026, 10, 18),
+        }
+        expected = '{"timestamp":"2026-10-18T12:00:00.123Z","day":"2026-10-18"}'
+
+        self.assertEqual(codec.get_codec("auto").dumps(value), expected)
+        for name in ("stdlib", "orjson"):
+            with self.subTest(codec=name):
+                try:
+                    json_codec = codec.get_codec(name)
+                except ImportError:
+                    continue
+                self.assertEqual(json_codec.dumps(value), expected)
+                self.assertEqual(json_codec.dumpb(value), expected.encode())
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_pack_unpack_round_trip(self):
+        frame = {
+            "type": "delta",
+            "base": 3,
+            "seq": 4,
+            "guesses": [guess(0, "1234", bulls=1), guess(1, "5612", cows=2)],
+            "changes": {"game_started": True, "remaining_guesses": 8},
+            "removed": ["winner"],
+        }
+
+        self.assertEqual(protocol.unpack(protocol.pack(frame)), frame)
+
+    def test_rows_keep_their_extra_fields(self):
+        row = {**guess(0, "1234"), "hint": "warm"}
+        packed = msgpack.unpackb(protocol.pack({"guesses": [row]}))
+
+        self.assertEqual(len(packed["g"][0]), 6)
+        self.assertEqual(
+            protocol.unpack(protocol.pack({"guesses": [row]})), {"guesses": [row]}
+        )
+
+    def test_unpack_rejects_bad_frames(self):
+        bad = {
+            "not msgpack": b"\xc1",
+            "not a map": msgpack.packb([1, 2]),
+            "short row": msgpack.packb({"g": [["player-1", [1, 2]]]}),
+            "long row": msgpack.packb({"g": [[None] * 7]}),
+        }
+        for name, data in bad.items():
+            with self.subTest(name), self.assertRaises(protocol.FrameError):
+                protocol.unpack(data)
+
+    def test_deltas_rebuild_the_state_across_a_reset(self):
+        first, second = guess(0, "1111"), guess(1, "2222", bulls=1)
+        states = [
+            {"version": 1, "players": [PLAYER["token"]], "game_started": False},
+            {"version": 2, "players": [PLAYER["token"]], "game_started": True},
+            {
+                "version": 3,
+                "players": [PLAYER["token"]],
+                "game_started": True,
+                "guesses": [first],
+            },
+            {
+                "version": 4,
+                "players": [PLAYER["token"]],
+                "game_started": True,
+                "guesses": [first, second],
+                "winner": PLAYER["token"],
+            },
+            # reset: the guesses shrink and the winner goes away
+            {
+                "version": 5,
+                "players": [PLAYER["token"]],
+                "game_started": False,
+                "guesses": [],
+            },
+            {
+                "version": 6,
+                "players": [PLAYER["token"]],
+                "game_started": True,
+                "guesses": [guess(2, "3333")],
+            },
+        ]
+
+        client = states[0]
+        for previous, current in pairwise(states):
+            frame = protocol.unpack(
+                protocol.pack(protocol.delta_frame(previous, current))
+            )
+            client = protocol.apply_delta(client, frame)
+            self.assertEqual(client, current)
+            if current["version"] == 5:
+                self.assertEqual(frame["changes"]["guesses"], [])
+                self.assertEqual(frame["removed"], ["winner"])
+
+        with self.assertRaises(ValueError):
+            protocol.apply_delta(states[0], protocol.delta_frame(states[1], states[2]))
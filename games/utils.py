@@ -1,15 +1,11 @@
 from typing import Optional
 from enum import Enum
 
-import jsonpickle
-from actstream import action
-from actstream.models import Action
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError
-from asgiref.sync import async_to_sync
 
 from bncapi.settings import TOKEN_KEY_LENGTH
+from games.activity import writer
 from games.models import Room
 from knoxtokens.models import KnoxToken
 import logging
@@ -34,6 +30,10 @@ def _validate_token(token: str) -> bool:
     return True
 
 
+def _token_key(token: str | None) -> str | None:
+    return token[:TOKEN_KEY_LENGTH] if token else None
+
+
 def _get_action_description(user_action: str, room, user) -> Optional[str]:
     if room is None or user is None:
         return None
@@ -51,7 +51,7 @@ async def _authenticate_user_async(token: str) -> Optional[User]:
         return None
 
     try:
-        token_key = token[:TOKEN_KEY_LENGTH]
+        token_key = _token_key(token)
         token_obj = await database_sync_to_async(
             KnoxToken.objects.select_related("user").get
         )(token_key=token_key)
@@ -75,118 +75,32 @@ async def _authenticate_user_async(token: str) -> Optional[User]:
         return None
 
 
-def _authenticate_user_sync(token: str) -> Optional[User]:
-    if not _validate_token(token):
-        return None
-
-    try:
-        token_key = token[:TOKEN_KEY_LENGTH]
-        token_obj = KnoxToken.objects.select_related("user").get(token_key=token_key)
-
-        if not token_obj.user:
-            logger.warning(
-                f"Knox token exists but user not found for token_key: {token_key[:8]}..."
-            )
-            return None
-
-        return token_obj.user
-
-    except KnoxToken.DoesNotExist:
-        logger.debug("Anonymous connection attempted - token not found")
-        return None
-    except Exception as e:
-        logger.error(
-            f"Error authenticating user: {type(e).__name__}: {e}",
-            exc_info=True,
-        )
-        return None
-
-
-async def _send_action_async(
-    user: User,
-    user_action: str,
-    room,
-    description: str | None = None,
-    data: dict | None = None,
-) -> bool:
-    try:
-        if data:
-            await database_sync_to_async(action.send)(
-                user,
-                verb=user_action,
-                target=room,
-                description=description,
-                data=jsonpickle.dumps(data),
-            )
-        else:
-            await database_sync_to_async(action.send)(
-                user,
-                verb=user_action,
-                action_object=room,
-                description=description,
-            )
-        logger.debug(
-            f"Action '{user_action}' sent for user {user.id} in room {room.id}"
-        )
-        return True
-    except Exception as e:
-        logger.error(
-            f"Error sending action '{user_action}': {type(e).__name__}: {e}",
-            exc_info=True,
-        )
-        return False
-
-
-def _send_action_sync(
-    user: User,
-    user_action: str,
-    room,
-    description: str | None = None,
-    data: dict | None = None,
-) -> bool:
-    try:
-
-        if data:
-            action.send(
-                user,
-                verb=user_action,
-                target=room,
-                description=description,
-                data=jsonpickle.dumps(data),
-            )
-        else:
-            action.send(
-                user,
-                verb=user_action,
-                action_object=room,
-                description=description,
-            )
-
-        logger.debug(
-            f"Action '{user_action}' sent for user {user.id} in room {room.id}"
-        )
-        return True
-    except Exception as e:
-        logger.error(
-            f"Error sending action '{user_action}': {type(e).__name__}: {e}",
-            exc_info=True,
-        )
-        return False
-
-
 async def log_user_action_async(
-    token: str, room, user_action: str, data: dict | None = None
+    token: str, room, user_action: str, data: dict | None = None, user=None
 ) -> bool:
+    """Queue an activity-stream action; never waits on the database.
+
+    Callers that already know the user pass it so the token isn't resolved again.
+    """
     if not user_action:
         logger.error("Invalid parameters: user_action is None")
         return False
 
-    user = await _authenticate_user_async(token)
-    if not user:
+    if user is not None:
+        return writer.record(user_action, room=room, data=data, user=user)
+
+    if not _validate_token(token):
         return False
 
-    description = _get_action_description(user_action, room, user)
-    return await _send_action_async(user, user_action, room, description, data)
+    return writer.record(user_action, room=room, data=data, token=token)
+
+
+def token_group_name(token: str | None) -> str | None:
+    """Channel-layer group of the connections authenticated with ``token``."""
+    token_key = _token_key(token)
+    if not token_key or not token_key.isalnum():
+        return None
+    return f"token_{token_key}"
 
 
 def log_user_action_sync(
@@ -196,9 +110,7 @@ def log_user_action_sync(
         logger.error("Invalid parameters: user_action is None")
         return False
 
-    user = _authenticate_user_sync(token)
-    if not user:
+    if not _validate_token(token):
         return False
 
-    description = _get_action_description(user_action, room, user)
-    return _send_action_sync(user, user_action, room, description, data)
+    return writer.record(user_action, room=room, data=data, token=token)
@@ -1,13 +1,25 @@
 from actstream.models import Action
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from ninja import Router, Query, Schema
 from ninja.errors import HttpError
-from typing import List
+from typing import List, Literal
 from actstream import action
+from channels.db import database_sync_to_async
 import json
 
+from bncapi import response_cache
+from bncapi.pagination import DEFAULT_PAGE_SIZE, akeyset_page
+from bncapi.conditional import conditional, namespace_stamp
+from bncapi.response_cache import cached_response
+from bncapi.serialization import object_response, page_response, rows_response
+from bncapi.streaming import ndjson_response
 from games.utils import log_user_action_sync
+from .auth import async_cached_token_auth
+from .hashing import PasswordHashBusyError
+from .models import UserStats, UserStatsBucket, window_start
 from .utils import CustomerAccountHandler
 from knoxtokens.models import KnoxToken
 
@@ -18,6 +30,8 @@ from .schemas import (
     UserCreate,
     UserLogin,
     ActivityFilterSchema,
+    ActivityPageSchema,
+    ActivityRangeSchema,
     ActivityResponseSchema,
 )
 
@@ -31,7 +45,39 @@ logger = logging.getLogger(__name__)
 user_router = Router(tags=["Users"])
 auth_router = Router(tags=["Authentication"], auth=None)
 
-from collections import Counter, defaultdict
+LEADERBOARD_LIMIT = 50
+LEADERBOARD_MAX_LIMIT = 500
+# window -> (bucket period, number of buckets summed, current one included)
+LEADERBOARD_WINDOWS = {
+    "day": (UserStatsBucket.HOUR, 24),
+    "week": (UserStatsBucket.DAY, 7),
+    "month": (UserStatsBucket.DAY, 30),
+}
+LeaderboardWindow = Literal["all", "day", "week", "month"]
+
+_leaderboard_generations = namespace_stamp(
+    response_cache.LEADERBOARD, response_cache.USERS
+)
+
+
+async def _leaderboard_stamp(request, window="all", **kwargs):
+    marker = await _leaderboard_generations(request)
+    if marker is None or window == "all":
+        return marker
+    # a window moves on to the next bucket without any write invalidating it
+    token, last_modified = marker
+    period, buckets = LEADERBOARD_WINDOWS[window]
+    return f"{token}:{window_start(period, buckets).isoformat()}", last_modified
+
+
+ACTIVITY_FIELDS = (
+    "id",
+    "verb",
+    "timestamp",
+    "actor_object_id",
+    "action_object_object_id",
+    "target_object_id",
+)
 
 
 class UserLeaderboardSchema(Schema):
@@ -47,38 +93,51 @@ class UserLeaderboardSchema(Schema):
     summary="Get leaderboard",
     auth=None,
 )
-def get_leaderboard(request):
+@conditional(_leaderboard_stamp)
+@cached_response(response_cache.LEADERBOARD, response_cache.USERS)
+async def get_leaderboard(
+    request, limit: int = LEADERBOARD_LIMIT, window: LeaderboardWindow = "all"
+):
     try:
-        actions = Action.objects.filter(verb__in=["won_game", "joined_room"]).values(
-            "actor_object_id", "verb"
-        )
-        user_lookup = {user.id: user.username for user in User.objects.all()}
-        user_activities = defaultdict(Counter)
-        for action in actions:
-            user_id = action["actor_object_id"]
-            user_activities[user_id][action["verb"]] += 1
-
-        stats = []
-        for user_id, activity_counts in user_activities.items():
-            if int(user_id) in user_lookup:
-                stats.append(
-                    {
-                        "username": user_lookup[int(user_id)],
-                        "games_won": activity_counts["won_game"],
-                        "joined_rooms": activity_counts["joined_room"],
-                        "win_rate": round(
-                            (
-                                activity_counts["won_game"]
-                                / activity_counts["joined_room"]
-                                if activity_counts["joined_room"] > 0
-                                else 0
-                            ),
-                            2,
-                        ),
-                    }
+        limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+        if window == "all":
+            stats = UserStats.objects.values(
+                username=F("user__username"),
+                won=F("games_won"),
+                joined=F("rooms_joined"),
+                rate=F("win_rate"),
+            ).order_by("-games_won", "-win_rate")
+        else:
+            period, buckets = LEADERBOARD_WINDOWS[window]
+            stats = (
+                UserStatsBucket.objects.filter(
+                    period=period, start__gte=window_start(period, buckets)
+                )
+                .values(username=F("user__username"))
+                .annotate(
+                    won=Sum("games_won"),
+                    joined=Sum("rooms_joined"),
+                    rate=Coalesce(
+                        Cast(Sum("games_won"), FloatField())
+                        / NullIf(Sum("rooms_joined"), 0),
+                        Value(0.0),
+                    ),
                 )
+                .order_by("-won", "-rate")
+            )
 
-        return [UserLeaderboardSchema.model_validate(s) for s in stats]
+        return rows_response(
+            UserLeaderboardSchema,
+            [
+                {
+                    "username": s["username"],
+                    "games_won": s["won"],
+                    "joined_rooms": s["joined"],
+                    "win_rate": round(s["rate"], 2),
+                }
+                async for s in stats[:limit]
+            ],
+        )
 
     except Exception as e:
         raise HttpError(500, f"Error fetching leaderboard: {str(e)}")
@@ -86,53 +145,70 @@ def get_leaderboard(request):
 
 @user_router.get(
     "/activities",
-    response=list[ActivityResponseSchema],
+    response=ActivityPageSchema,
     summary="Get user and user's activities",
+    auth=async_cached_token_auth,
 )
-def get_user_activities(request, filters: Query[ActivityFilterSchema] = None):
-    # get user and user's activities from actstream
+async def get_user_activities(
+    request,
+    filters: Query[ActivityFilterSchema] = None,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    # get user and user's activities from actstream, newest first
     try:
         stream = Action.objects.all()
 
         if filters:
             stream = filters.filter(stream)
 
-        activities = list(
-            stream.values(
-                "id",
-                "verb",
-                "timestamp",
-                "actor_object_id",
-                "action_object_object_id",
-                "target_object_id",
-            )
+        activities, next_cursor = await akeyset_page(
+            stream.values(*ACTIVITY_FIELDS), cursor, limit
         )
 
-        return [ActivityResponseSchema.model_validate(a) for a in activities]
+        return page_response(ActivityResponseSchema, activities, next_cursor)
 
     except User.DoesNotExist:
         raise HttpError(404, "User not found")
 
 
-@user_router.get("/me", response=MeResponse, summary="Get current user")
-def me(request):
+@user_router.get(
+    "/activities/export",
+    summary="Export activities as NDJSON",
+    auth=async_cached_token_auth,
+)
+async def export_user_activities(
+    request, filters: Query[ActivityFilterSchema] = None, after_id: int | None = None
+):
+    # one JSON object per line in id order; resume with after_id=<last id seen>
+    stream = Action.objects.all()
+    if filters:
+        stream = filters.filter(stream)
+    return ndjson_response(request, stream.values(*ACTIVITY_FIELDS), after_id)
+
+
+@user_router.get(
+    "/me",
+    response=MeResponse,
+    summary="Get current user",
+    auth=async_cached_token_auth,
+)
+async def me(
+    request,
+    filters: Query[ActivityRangeSchema] = None,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
     user, token = request.auth
     if not user or not user.is_authenticated:
         raise HttpError(401, "Unauthorized")
 
-    user_dict = UserSchema.from_orm(user)
+    stream = Action.objects.filter(actor_object_id=user.id)
+    if filters:
+        stream = filters.filter(stream)
 
-    stream = Action.objects.all()
-    stream = stream.filter(actor_object_id=user.id)
-    activities = list(
-        stream.values(
-            "id",
-            "verb",
-            "timestamp",
-            "actor_object_id",
-            "action_object_object_id",
-            "target_object_id",
-        )
+    activities, next_cursor = await akeyset_page(
+        stream.values(*ACTIVITY_FIELDS), cursor, limit
     )
     return MeResponse.model_validate(
         {
@@ -142,20 +218,35 @@ def me(request):
             "activities": [
                 ActivityResponseSchema.model_validate(a) for a in activities
             ],
+            "next_cursor": next_cursor,
         }
     )
 
 
-@user_router.get("/", response=List[UserSchema], summary="List all users")
-def list_users(request):
-    return [UserSchema.from_orm(user) for user in User.objects.all()]
+@user_router.get(
+    "/",
+    response=List[UserSchema],
+    summary="List all users",
+    auth=async_cached_token_auth,
+)
+@conditional(namespace_stamp(response_cache.USERS))
+async def list_users(request):
+    users = User.objects.values(*UserSchema.Meta.fields)
+    return rows_response(UserSchema, [user async for user in users])
 
 
-@user_router.get("/{user_id}", response=UserSchema, summary="Get user by ID")
-def get_user(request, user_id: int):
+@user_router.get(
+    "/{user_id}",
+    response=UserSchema,
+    summary="Get user by ID",
+    auth=async_cached_token_auth,
+)
+@conditional(namespace_stamp(response_cache.USERS))
+@cached_response(response_cache.USERS)
+async def get_user(request, user_id: int):
     try:
-        user = User.objects.get(id=user_id)
-        return UserSchema.from_orm(user)
+        user = await User.objects.values(*UserSchema.Meta.fields).aget(id=user_id)
+        return object_response(UserSchema, user)
     except User.DoesNotExist:
         raise HttpError(404, "User not found")
 
@@ -166,10 +257,12 @@ def get_user(request, user_id: int):
 
 
 @auth_router.post("/login", response=AuthResponse, summary="Login user")
-def login(request, data: UserLogin):
+async def login(request, data: UserLogin):
     try:
         validated_data = data.dict()
-        user, token_info = CustomerAccountHandler(**validated_data).login()
+        user, token_info = await CustomerAccountHandler(
+            **validated_data
+        ).login_async()
         token = token_info["token_value"]
         expiry = token_info["expiry"]
 
@@ -210,6 +303,8 @@ def login(request, data: UserLogin):
             expiry=expiry,
         )
 
+    except PasswordHashBusyError:
+        raise HttpError(503, "Too many login attempts, please try again")
     except KnoxToken.DoesNotExist:
         logger.error("Invalid token during login")
         raise HttpError(400, "Invalid token")
@@ -222,10 +317,12 @@ def login(request, data: UserLogin):
 
 
 @auth_router.post("/signup", response=AuthResponse, summary="Register user")
-def signup(request, data: UserCreate):
+async def signup(request, data: UserCreate):
     try:
         validated_data = data.dict()
-        user, token_info = CustomerAccountHandler(**validated_data).email_signup()
+        user, token_info = await CustomerAccountHandler(
+            **validated_data
+        ).email_signup_async()
         token = token_info["token_value"]
         expiry = token_info["expiry"]
 
@@ -236,17 +333,36 @@ def signup(request, data: UserCreate):
         }
 
         user_json = json.dumps(user_dict)
-        request.session["user"] = user_json
+        await request.session.aset("user", user_json)
 
-        action.send(user, verb="registered", action_object=user, data=user_dict)
+        await database_sync_to_async(action.send)(
+            user, verb="registered", action_object=user, data=user_dict
+        )
 
         return AuthResponse(
             token=token,
             username=user.username,
             expiry=expiry,
         )
+    except PasswordHashBusyError:
+        raise HttpError(503, "Too many signups, please try again")
     except IntegrityError:
         raise HttpError(400, "User with this email or username already exists")
     except Exception as e:
         logger.error(f"Signup error: {e}")
         raise HttpError(400, "Registration failed")
+
+
+@auth_router.post(
+    "/logout",
+    response={204: None},
+    summary="Logout user",
+    auth=async_cached_token_auth,
+)
+async def logout(request):
+    user, auth_token = request.auth
+    # deleting the token evicts it from the verification cache (users.signals)
+    await KnoxToken.objects.filter(
+        token_key=auth_token.token_key, user=user
+    ).adelete()
+    return 204, None
@@ -8,3 +8,4 @@ class UsersConfig(AppConfig):
     def ready(self):
         from actstream import registry
         registry.register(self.get_model('User'))
+        from . import signals  # noqa: F401
@@ -0,0 +1,165 @@
+"""Knox token verification with a cache in front of it.
+
+A verified token is remembered, keyed by its ``token_key`` and checked against a
+SHA-256 digest of the full token, so repeat requests from the same client skip
+the token lookup and Knox's digest comparison. No entry outlives the token's
+expiry.
+
+When ``TOKEN_CACHE_ALIAS`` names a Django cache shared by all workers, entries
+live there alone for up to ``TOKEN_CACHE_TTL`` seconds, and deleting a
+KnoxToken (logout) revokes it everywhere at once. Otherwise they live in a
+process-local LRU for ``TOKEN_CACHE_LOCAL_TTL`` seconds: logout evicts the
+token from the worker that handled it, and every other worker keeps accepting
+it for at most that long.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from knoxtokens.auth import TokenAuthentication, async_token_auth
+from ninja.security import HttpBearer
+
+from bncapi import metrics
+
+CACHE_SIZE = getattr(settings, "TOKEN_CACHE_SIZE", 10000)
+CACHE_TTL = getattr(settings, "TOKEN_CACHE_TTL", 300)
+LOCAL_TTL = getattr(settings, "TOKEN_CACHE_LOCAL_TTL", 10)
+CACHE_ALIAS = getattr(settings, "TOKEN_CACHE_ALIAS", None)
+TOKEN_KEY_LENGTH = getattr(settings, "TOKEN_KEY_LENGTH", 8)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    def __init__(
+        self, max_size=CACHE_SIZE, ttl=CACHE_TTL, alias=CACHE_ALIAS, local_ttl=LOCAL_TTL
+    ):
+        self.max_size = max_size
+        # the shared cache is authoritative when there is one: a local copy
+        # would outlive a logout handled by another worker
+        self.ttl = ttl if alias else min(ttl, local_ttl)
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        """``(user, auth_token)`` for a previously verified token, else None."""
+        if not token or self.ttl <= 0:
+            return None
+
+        key = token[:TOKEN_KEY_LENGTH]
+        digest = _digest(token)
+
+        if self.alias:
+            shared = self._shared().get(self._shared_key(key))
+            if shared is not None and hmac.compare_digest(shared[0], digest):
+                metrics.incr("token_cache.shared_hit")
+                return shared[1], shared[2]
+            metrics.incr("token_cache.miss")
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[3] <= now:
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+
+        if entry is not None and hmac.compare_digest(entry[0], digest):
+            metrics.incr("token_cache.hit")
+            return entry[1], entry[2]
+
+        metrics.incr("token_cache.miss")
+        return None
+
+    def set(self, token: str, user, auth_token):
+        ttl = self.ttl
+        expiry = getattr(auth_token, "expiry", None)
+        if expiry is not None:
+            ttl = min(ttl, (expiry - timezone.now()).total_seconds())
+        if not token or ttl <= 0:
+            return
+
+        key = token[:TOKEN_KEY_LENGTH]
+        entry = (_digest(token), user, auth_token, time.time() + ttl)
+        if self.alias:
+            self._shared().set(self._shared_key(key), entry, timeout=int(ttl) or 1)
+        else:
+            self._remember(key, entry)
+
+    def invalidate(self, token_key: str):
+        with self._lock:
+            self._entries.pop(token_key, None)
+        if self.alias:
+            self._shared().delete(self._shared_key(token_key))
+        metrics.incr("token_cache.invalidated")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _shared(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _shared_key(token_key):
+        return f"knox-token:{token_key}"
+
+
+token_cache = TokenCache()
+metrics.gauge("token_cache.size", token_cache.__len__)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that consults ``token_cache`` first."""
+
+    def authenticate(self, request, token):
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        result = super().authenticate(request, token)
+        if result:
+            user, auth_token = result
+            token_cache.set(token, user, auth_token)
+        return result
+
+
+class AsyncCachedTokenAuthentication(HttpBearer):
+    """Cached counterpart of ``async_token_auth`` for async operations."""
+
+    is_async = True
+
+    async def authenticate(self, request, token):
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        result = await async_token_auth(request)
+        if result:
+            user, auth_token = result
+            token_cache.set(token, user, auth_token)
+        return result
+
+
+async_cached_token_auth = AsyncCachedTokenAuthentication()
@@ -0,0 +1,116 @@
+"""Password hashing in a dedicated process pool.
+
+PBKDF2 is deliberately slow CPU work. Run on the event loop it stalls every
+other request on the worker, and in the sync_to_async thread pool it still
+holds the GIL. ``hash_password`` and ``verify_password`` hand it to a pool of
+``PASSWORD_HASH_WORKERS`` processes, started on first use.
+
+At most ``PASSWORD_HASH_MAX_PENDING`` hashes may be running or queued per
+process; past that ``PasswordHashBusyError`` is raised straight away, so a login
+storm is shed with 503s instead of building an ever longer queue. Pending,
+queued and rejected counts are exported through ``bncapi.metrics``.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from bncapi import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKERS = getattr(settings, "PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+MAX_PENDING = getattr(settings, "PASSWORD_HASH_MAX_PENDING", 64)
+
+
+class PasswordHashBusyError(Exception):
+    pass
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _verify_password(password, encoded):
+    # an unusable password still costs one hash: Django hashes a random one so
+    # the timing doesn't tell whether the account exists
+    if encoded is None:
+        encoded = hashers.UNUSABLE_PASSWORD_PREFIX
+    return hashers.verify_password(password, encoded)
+
+
+class PasswordHasherPool:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: this process runs threads and an event loop.
+                # Workers read PASSWORD_HASHERS from the inherited
+                # DJANGO_SETTINGS_MODULE and never load any app.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _admit(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                metrics.incr("password_hash.rejected")
+                raise PasswordHashBusyError("Too many password hashes pending")
+            self.pending += 1
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, fn, *args):
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool(), fn, *args)
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed): the next call starts a new pool
+            logger.error("Password hash pool broken, restarting it")
+            self.shutdown(wait=False)
+            raise
+        finally:
+            self._release()
+            metrics.incr("password_hash.completed")
+
+    def queued(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    def shutdown(self, *, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+hasher_pool = PasswordHasherPool()
+
+
+async def hash_password(password) -> str:
+    return await hasher_pool.run(_make_password, password)
+
+
+async def verify_password(password, encoded) -> tuple[bool, bool]:
+    """``(is_correct, must_update)``, as ``django.contrib.auth.hashers``."""
+    return await hasher_pool.run(_verify_password, password, encoded)
+
+
+metrics.gauge("password_hash.pending", lambda: hasher_pool.pending)
+metrics.gauge("password_hash.queued", hasher_pool.queued)
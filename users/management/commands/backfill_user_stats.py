@@ -0,0 +1,110 @@
+from datetime import timezone as dt_timezone
+
+from actstream.models import Action
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from games.activity import STAT_JOINED, STAT_WON
+from users.models import UserStats, UserStatsBucket, bucket_start
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the leaderboard totals and time buckets from the activity stream"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # the activity writer's stats update waits for this rebuild, so a
+                # batch is counted either by the backfill or by the writer, not both
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"LOCK TABLE {UserStats._meta.db_table}, "
+                        f"{UserStatsBucket._meta.db_table} IN EXCLUSIVE MODE"
+                    )
+            user_ids = set(User.objects.values_list("id", flat=True))
+            stats = self._totals(user_ids)
+            buckets = self._buckets(user_ids)
+            UserStats.objects.all().delete()
+            UserStats.objects.bulk_create(stats, batch_size=1000)
+            UserStatsBucket.objects.all().delete()
+            UserStatsBucket.objects.bulk_create(buckets, batch_size=1000)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfilled leaderboard stats for {len(stats)} users "
+                f"and {len(buckets)} time buckets"
+            )
+        )
+
+    @staticmethod
+    def _counted_actions():
+        return Action.objects.filter(
+            actor_content_type=ContentType.objects.get_for_model(User),
+            verb__in=[STAT_WON, STAT_JOINED],
+        )
+
+    def _totals(self, user_ids) -> list:
+        totals = (
+            self._counted_actions()
+            .values("actor_object_id")
+            .annotate(
+                won=Count("id", filter=Q(verb=STAT_WON)),
+                joined=Count("id", filter=Q(verb=STAT_JOINED)),
+            )
+        )
+        stats = []
+        for row in totals.iterator():
+            user_id = int(row["actor_object_id"])
+            if user_id not in user_ids:
+                continue
+            stats.append(
+                UserStats(
+                    user_id=user_id,
+                    games_won=row["won"],
+                    rooms_joined=row["joined"],
+                    win_rate=row["won"] / row["joined"] if row["joined"] else 0.0,
+                )
+            )
+        return stats
+
+    def _buckets(self, user_ids) -> list:
+        now = timezone.now()
+        retention = (
+            (UserStatsBucket.HOUR, TruncHour, UserStatsBucket.HOUR_RETENTION),
+            (UserStatsBucket.DAY, TruncDay, UserStatsBucket.DAY_RETENTION),
+        )
+
+        buckets = []
+        for period, trunc, keep in retention:
+            rows = (
+                self._counted_actions()
+                # whole buckets only, so none starts out partially counted
+                .filter(timestamp__gte=bucket_start(now - keep, period))
+                .annotate(start=trunc("timestamp", tzinfo=dt_timezone.utc))
+                .values("actor_object_id", "start")
+                .annotate(
+                    won=Count("id", filter=Q(verb=STAT_WON)),
+                    joined=Count("id", filter=Q(verb=STAT_JOINED)),
+                )
+            )
+            for row in rows.iterator():
+                user_id = int(row["actor_object_id"])
+                if user_id not in user_ids:
+                    continue
+                buckets.append(
+                    UserStatsBucket(
+                        user_id=user_id,
+                        period=period,
+                        start=row["start"],
+                        games_won=row["won"],
+                        rooms_joined=row["joined"],
+                    )
+                )
+        return buckets
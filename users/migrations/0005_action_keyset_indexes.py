@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:02
+
+from django.db import migrations
+
+# actstream owns the Action table; these back the keyset-paginated activity
+# endpoints, which read (timestamp DESC, id DESC), optionally per actor and verb
+INDEXES = {
+    "actstream_action_ts_id_idx": "(timestamp DESC, id DESC)",
+    "actstream_action_actor_ts_id_idx": "(actor_object_id, timestamp DESC, id DESC)",
+    "actstream_action_actor_verb_ts_idx": (
+        "(actor_object_id, verb, timestamp DESC, id DESC)"
+    ),
+}
+
+
+def _concurrently(schema_editor) -> str:
+    # the table takes a write on every move: PostgreSQL builds the indexes
+    # without locking it (and only outside a transaction, hence atomic = False)
+    return " CONCURRENTLY" if schema_editor.connection.vendor == "postgresql" else ""
+
+
+def create_indexes(apps, schema_editor):
+    for name, columns in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX{_concurrently(schema_editor)} IF NOT EXISTS {name} "
+            f"ON actstream_action {columns}"
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    for name in INDEXES:
+        schema_editor.execute(
+            f"DROP INDEX{_concurrently(schema_editor)} IF EXISTS {name}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("actstream", "0003_add_follow_flag"),
+        ("users", "0004_userstatsbucket"),
+    ]
+
+    operations = [migrations.RunPython(create_indexes, drop_indexes)]
@@ -3,13 +3,19 @@ from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.hashers import make_password
 from django.core.validators import validate_email, ValidationError
 from django.db import models
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from datetime import timedelta, timezone as dt_timezone
+
 from django.utils import timezone
 
+from .hashing import hash_password
+
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
 
-    def create_user(self, email, username, password, **extra_fields):
+    def _user_fields(self, email, username, password) -> dict:
         if not username:
             raise ValueError("The given username must be set")
         if not password:
@@ -21,14 +27,24 @@ class UserManager(BaseUserManager):
             validate_email(email)
         except ValidationError as e:
             raise ValueError(f"Invalid email address: {e}")
+        return {"email": email, "username": username}
 
+    def create_user(self, email, username, password, **extra_fields):
         return User.objects.create(
-            email=email,
-            username=username,
+            **self._user_fields(email, username, password),
             password=make_password(password),
             **extra_fields,
         )
 
+    async def anew_user_fields(self, email, username, password) -> dict:
+        """Validated fields of a new user, the password hashed in the pool."""
+        fields = self._user_fields(email, username, password)
+        return {**fields, "password": await hash_password(password)}
+
+    async def acreate_user(self, email, username, password, **extra_fields):
+        fields = await self.anew_user_fields(email, username, password)
+        return await User.objects.acreate(**fields, **extra_fields)
+
     def create_superuser(self, login_id, password=None):
         extra_fields = {
             "is_superuser": True,
@@ -51,4 +67,133 @@ class User(AbstractBaseUser):
     objects = UserManager()
 
     def __str__(self) -> str:
-        return super().__str__()
\ No newline at end of file
+        return super().__str__()
+
+
+class UserStatsManager(models.Manager):
+    def add(self, counts: dict):
+        """Add ``{user_id: (games_won, rooms_joined)}`` to the running totals."""
+        if not counts:
+            return
+
+        self.bulk_create(
+            [UserStats(user_id=user_id) for user_id in counts], ignore_conflicts=True
+        )
+        for user_id, (won, joined) in counts.items():
+            games_won = F("games_won") + won
+            rooms_joined = F("rooms_joined") + joined
+            self.filter(user_id=user_id).update(
+                games_won=games_won,
+                rooms_joined=rooms_joined,
+                win_rate=Coalesce(
+                    Cast(games_won, FloatField()) / NullIf(rooms_joined, 0),
+                    Value(0.0),
+                ),
+                updated_at=timezone.now(),
+            )
+
+
+class UserStats(models.Model):
+    """Per-user leaderboard totals, kept current by the activity writer."""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    games_won = models.PositiveIntegerField(default=0)
+    rooms_joined = models.PositiveIntegerField(default=0)
+    win_rate = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserStatsManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-games_won", "-win_rate"], name="userstats_leaderboard_idx"
+            ),
+        ]
+
+
+def bucket_start(moment, period):
+    start = moment.astimezone(dt_timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+    if period == UserStatsBucket.DAY:
+        start = start.replace(hour=0)
+    return start
+
+
+def window_start(period, buckets, now=None):
+    """Start of the earliest of the last ``buckets`` buckets, the current one
+    included."""
+    length = timedelta(hours=1) if period == UserStatsBucket.HOUR else timedelta(days=1)
+    return bucket_start(now or timezone.now(), period) - (buckets - 1) * length
+
+
+class UserStatsBucketManager(models.Manager):
+    def add(self, events):
+        """Count ``(user_id, timestamp, games_won, rooms_joined)`` events into
+        their hour and day buckets."""
+        counts = {}
+        for user_id, timestamp, won, joined in events:
+            for period in (UserStatsBucket.HOUR, UserStatsBucket.DAY):
+                key = (user_id, period, bucket_start(timestamp, period))
+                total_won, total_joined = counts.get(key, (0, 0))
+                counts[key] = (total_won + won, total_joined + joined)
+        if not counts:
+            return
+
+        self.bulk_create(
+            [
+                UserStatsBucket(user_id=user_id, period=period, start=start)
+                for user_id, period, start in counts
+            ],
+            ignore_conflicts=True,
+        )
+        for (user_id, period, start), (won, joined) in counts.items():
+            self.filter(user_id=user_id, period=period, start=start).update(
+                games_won=F("games_won") + won,
+                rooms_joined=F("rooms_joined") + joined,
+            )
+
+    def prune(self, now=None):
+        """Drop buckets older than any window still reads."""
+        now = now or timezone.now()
+        return self.filter(
+            models.Q(
+                period=UserStatsBucket.HOUR,
+                start__lt=now - UserStatsBucket.HOUR_RETENTION,
+            )
+            | models.Q(
+                period=UserStatsBucket.DAY,
+                start__lt=now - UserStatsBucket.DAY_RETENTION,
+            )
+        ).delete()[0]
+
+
+class UserStatsBucket(models.Model):
+    """Leaderboard counts for one user over one hour or one UTC day."""
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+
+    HOUR_RETENTION = timedelta(days=2)
+    DAY_RETENTION = timedelta(days=32)
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="stats_buckets"
+    )
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    start = models.DateTimeField()
+    games_won = models.PositiveIntegerField(default=0)
+    rooms_joined = models.PositiveIntegerField(default=0)
+
+    objects = UserStatsBucketManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "start", "user"], name="unique_stats_bucket"
+            ),
+        ]
@@ -1,5 +1,5 @@
 from actstream.models import Action
-from ninja import ModelSchema, Schema, FilterSchema
+from ninja import Field, ModelSchema, Schema, FilterSchema
 from django.contrib.auth import get_user_model
 from pydantic import EmailStr
 from datetime import datetime
@@ -7,9 +7,14 @@ from datetime import datetime
 User = get_user_model()
 
 
-class ActivityFilterSchema(FilterSchema):
-    actor_object_id: int | None = None
+class ActivityRangeSchema(FilterSchema):
     verb: str | None = None
+    since: datetime | None = Field(None, q="timestamp__gte")
+    until: datetime | None = Field(None, q="timestamp__lt")
+
+
+class ActivityFilterSchema(ActivityRangeSchema):
+    actor_object_id: int | None = None
     action_object_object_id: int | None = None
     timestamp: datetime | None = None
 
@@ -23,6 +28,11 @@ class ActivityResponseSchema(Schema):
     target_object_id: int | None
 
 
+class ActivityPageSchema(Schema):
+    items: list[ActivityResponseSchema]
+    next_cursor: str | None
+
+
 class UserSchema(ModelSchema):
     class Meta:
         model = User
@@ -35,6 +45,7 @@ class UserResponse(UserSchema):
 
 class MeResponse(UserSchema):
     activities: list[ActivityResponseSchema]
+    next_cursor: str | None = None
 
     class Meta:
         fields = UserSchema.Meta.fields + ["activities"]
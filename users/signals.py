@@ -0,0 +1,27 @@
+from actstream.models import Action
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bncapi import response_cache
+from knoxtokens.models import KnoxToken
+from .auth import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=KnoxToken)
+def invalidate_cached_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.token_key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_users(sender, instance, **kwargs):
+    response_cache.invalidate(response_cache.USERS)
+
+
+@receiver(post_save, sender=Action)
+def invalidate_cached_leaderboard(sender, instance, **kwargs):
+    # the activity writer's bulk inserts send no signals; it invalidates itself
+    response_cache.invalidate(response_cache.LEADERBOARD)
@@ -1,3 +1,43 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from games.utils import token_group_name
+from knoxtokens.models import KnoxToken
+from knoxtokens.utils import CreateToken
+from .auth import token_cache
+from .models import User
+
+
+class TokenCacheInvalidationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(email="player@example.com", username="player")
+        self.token, _expiry = CreateToken(user=self.user).create()
+        self.auth_token = KnoxToken.objects.get(token_key=self.token[:8])
+        token_cache.set(self.token, self.user, self.auth_token)
+        self.assertIsNotNone(token_cache.get(self.token))
+
+    def test_logout_evicts_the_token(self):
+        response = self.client.post(
+            "/api/auth/logout", headers={"Authorization": f"Bearer {self.token}"}
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(token_cache.get(self.token))
+        self.assertFalse(KnoxToken.objects.filter(pk=self.auth_token.pk).exists())
+
+    @override_settings(
+        CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    )
+    def test_revoking_the_token_evicts_it_and_tells_its_sockets(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(token_group_name(self.token), channel)
+
+        self.auth_token.delete()
+
+        self.assertIsNone(token_cache.get(self.token))
+        self.assertEqual(
+            async_to_sync(layer.receive)(channel), {"type": "token_revoked"}
+        )
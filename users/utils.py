@@ -1,11 +1,12 @@
 import logging
 
 # from django.conf import settings
-from django.contrib.auth import authenticate
-from django.db import transaction, IntegrityError
+from channels.db import database_sync_to_async
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 from knoxtokens.utils import CreateToken
+from . import hashing
 from .models import User
 
 
@@ -17,48 +18,50 @@ class CustomerAccountHandler:
         self.password = kwargs.get("password", None)
         self.username = kwargs.get("username", None)
 
-    def login(self):
-        user = self._authenticate()
-        token_value, expiry = CreateToken(user=user).create()
+    async def login_async(self):
+        user = await self._authenticate_async()
+        token_value, expiry = await database_sync_to_async(
+            CreateToken(user=user).create
+        )()
         return user, {"token_value": token_value, "expiry": expiry}
 
-    def _authenticate(self):
+    async def _authenticate_async(self):
         email = self.email.lower() if self.email else None
 
         # TODO: validate email with pydantic
         # TODO: authenticate using username
-        data = {"email": email, "password": self.password}
+        user = await User.objects.filter(email=email).afirst()
 
-        # authenticate with the authentication middleware from django project settings ("django.contrib.auth.middleware.AuthenticationMiddleware")
-        user = authenticate(
-            username=email,
-            password=self.password,
+        # exactly one hash, in the hashing pool, whether or not the user exists
+        is_correct, must_update = await hashing.verify_password(
+            self.password, user.password if user else None
         )
-        if not user:
-            try:
-                potential_user = User.objects.get(email=email)
-            except User.DoesNotExist:
-                raise Exception("User does not exist")
-            if potential_user.check_password(self.password):
-                self.user = potential_user
-                return potential_user
+        if user is None:
+            raise Exception("User does not exist")
+        if not is_correct or not user.is_active:
             raise Exception("Incorrect password or email")
-        else:
-            User.objects.filter(id=user.id).update(
-                last_login=timezone.now(),
-            )
-            return user
 
-    @transaction.atomic
-    def email_signup(self):
+        fields = {"last_login": timezone.now()}
+        if must_update:
+            # hasher or work factor changed since the password was set
+            fields["password"] = await hashing.hash_password(self.password)
+        await User.objects.filter(id=user.id).aupdate(**fields)
+        self.user = user
+        return user
+
+    async def email_signup_async(self):
         email = self.email.lower() if self.email else None
         username = self.username.lower() if self.username else None
+        # hashed in the pool before the transaction, which then only inserts
+        fields = await User.objects.anew_user_fields(email, username, self.password)
+        return await self._create_account(fields)
+
+    @staticmethod
+    @database_sync_to_async
+    @transaction.atomic
+    def _create_account(fields):
         try:
-            user = User.objects.create_user(
-                email=email,
-                username=username,
-                password=self.password,
-            )
+            user = User.objects.create(**fields)
         except IntegrityError as e:
             logging.error(e)
             return